@@ -17,12 +17,26 @@ class Config:
     recursion_limit: int = 100  # LangGraph recursion limit
     # Input writer generation mode:
     # - "sequential_dependency": generate files sequentially; use already-generated files as context to enforce consistency.
+    # - "tiered_dependency": generate files of the same folder tier (system -> constant -> 0 -> other) in parallel;
+    #   each file sees the files of the previous tiers as context.
     # - "parallel_no_context": generate files in parallel without cross-file context (faster, may need more reviewer iterations).
     input_writer_generation_mode: str = "sequential_dependency"
+    # Input writer rewrite protocol (reviewer loop):
+    # - "full_content": the LLM returns complete corrected files.
+    # - "unified_diff": the LLM returns unified diffs against the current files (fewer tokens);
+    #   files whose patch does not apply cleanly are regenerated with "full_content".
+    input_writer_rewrite_protocol: str = "full_content"
     # Optional: reuse previously generated files by copying from this directory.
     # If set, InputWriter will check <reuse_generated_dir>/<folder>/<file> first.
     # When present, it will copy into the current case_dir and skip LLM generation.
     reuse_generated_dir: str = ""
+    # Opt-in on-disk cache of LLM responses for identical prompts (reviewer and visualization calls),
+    # stored under $FOAMAGENT_CACHE_DIR/llm, plus an in-process memo of simulation plans.
+    # Also enabled by FOAMAGENT_LLM_CACHE=1.
+    llm_response_cache: bool = False
+    # Opt-in: run visualization scripts forked from a long-lived worker process (viz_worker.py) with PyVista preloaded,
+    # so retries skip interpreter + VTK import startup (POSIX only). Also enabled by FOAMAGENT_VIZ_PERSISTENT_WORKER=1.
+    visualization_persistent_worker: bool = False
     # LLM backend:
     # - "openai": OpenAI Platform usage-based (API key)
     # - "openai-codex": ChatGPT/Codex subscription sign-in (Codex auth cache)
@@ -119,3 +133,21 @@ class Config:
                 print(f"<config>openfoam_fork={self.openfoam_fork} (default; invalid env:{fork_key}={fork_env!r})</config>")
         else:
             print(f"<config>openfoam_fork={self.openfoam_fork} (default)</config>")
+
+        # LLM response cache override
+        llm_cache_key = "FOAMAGENT_LLM_CACHE"
+        llm_cache_env = _env_nonempty(llm_cache_key)
+        if llm_cache_env is not None:
+            self.llm_response_cache = llm_cache_env.lower() in {"1", "true", "yes", "on"}
+            print(f"<config>llm_response_cache={self.llm_response_cache} (env:{llm_cache_key})</config>")
+        else:
+            print(f"<config>llm_response_cache={self.llm_response_cache} (default)</config>")
+
+        # Persistent visualization worker override
+        viz_worker_key = "FOAMAGENT_VIZ_PERSISTENT_WORKER"
+        viz_worker_env = _env_nonempty(viz_worker_key)
+        if viz_worker_env is not None:
+            self.visualization_persistent_worker = viz_worker_env.lower() in {"1", "true", "yes", "on"}
+            print(f"<config>visualization_persistent_worker={self.visualization_persistent_worker} (env:{viz_worker_key})</config>")
+        else:
+            print(f"<config>visualization_persistent_worker={self.visualization_persistent_worker} (default)</config>")
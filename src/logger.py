@@ -13,8 +13,15 @@ Usage:
     # ... all subsequent print() calls are captured in workflow.log ...
     log_review(error_text, "error_logs")  # also writes to review.log
     close_logging()                       # restore stdout, close files
+
+Modules also log through the standard ``logging`` module
+(``logging.getLogger(__name__)``). Once ``setup_logging`` has run, INFO and
+above from this package's loggers (services.*, nodes.*, router_func) is
+written to stdout as well, and so ends up in workflow.log; DEBUG messages
+are only emitted when enabled explicitly.
 """
 
+import logging
 import os
 import sys
 from typing import Optional, TextIO
@@ -42,6 +49,10 @@ class _TeeWriter:
         return getattr(self._original, name)
 
 
+# Loggers of this package whose INFO messages belong in the workflow transcript.
+_PACKAGE_LOGGERS = ("services", "nodes", "router_func")
+
+
 class FoamAgentLogger:
     """Singleton logger that tees stdout to workflow.log and provides review.log."""
 
@@ -51,6 +62,7 @@ class FoamAgentLogger:
         self._workflow_file: Optional[TextIO] = None
         self._review_file: Optional[TextIO] = None
         self._original_stdout: Optional[TextIO] = None
+        self._log_handler: Optional[logging.Handler] = None
         self._initialized = False
 
     @classmethod
@@ -74,10 +86,23 @@ class FoamAgentLogger:
 
         self._original_stdout = sys.stdout
         sys.stdout = _TeeWriter(self._original_stdout, self._workflow_file)
+
+        self._log_handler = logging.StreamHandler(sys.stdout)
+        self._log_handler.setLevel(logging.INFO)
+        self._log_handler.setFormatter(logging.Formatter("[%(levelname)s] %(name)s: %(message)s"))
+        for name in _PACKAGE_LOGGERS:
+            package_logger = logging.getLogger(name)
+            package_logger.addHandler(self._log_handler)
+            if package_logger.level == logging.NOTSET:
+                package_logger.setLevel(logging.INFO)
         self._initialized = True
 
     def close(self) -> None:
         """Close log files and restore stdout."""
+        if self._log_handler is not None:
+            for name in _PACKAGE_LOGGERS:
+                logging.getLogger(name).removeHandler(self._log_handler)
+            self._log_handler = None
         if self._original_stdout is not None:
             sys.stdout = self._original_stdout
             self._original_stdout = None
@@ -86,6 +86,7 @@ def initialize_state(user_requirement: str, config: Config, custom_mesh_path: Op
         custom_mesh_path=custom_mesh_path,
         review_analysis=None,
         rewrite_plan=None,
+        review_action=None,
         input_writer_mode="initial",
         requires_hpc=None,
         requires_visualization=None,
@@ -119,6 +120,8 @@ def main(user_requirement: str, config: Config, custom_mesh_path: Optional[str]
         termination_reason = result.get("termination_reason")
         if termination_reason == "max_review_loop_reached":
             print("<workflow_end>Workflow finished after reaching the maximum review loop limit.</workflow_end>")
+        elif termination_reason == "reviewer_halted":
+            print("<workflow_end>Workflow stopped: the reviewer found errors that file edits cannot fix.</workflow_end>")
         else:
             print("<workflow_end>Workflow completed successfully!</workflow_end>")
 
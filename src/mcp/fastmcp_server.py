@@ -101,6 +101,7 @@ async def plan(
             case_stats=case_stats,
             case_dir="",  # Will be resolved later
             searchdocs=global_config.searchdocs,
+            use_cache=global_config.llm_response_cache,
         )
         
         await ctx.info(f"Generated {len(plan_data['subtasks'])} subtasks")
@@ -240,6 +241,7 @@ async def input_writer(
             searchdocs=global_config.searchdocs,
             similar_case_advice=similar_case_advice,
             progress_callback=progress_callback,
+            config=global_config,
         )
 
         await ctx.info(f"result: {result}")
@@ -405,22 +407,26 @@ async def review(
             "case_category": "tutorial"
         }
         
-        tutorial_reference, _, _, _, _ = retrieve_references(
-            case_name=case_info["case_name"],
-            case_solver=case_info["case_solver"],
-            case_domain=case_info["case_domain"],
-            case_category=case_info["case_category"],
-            searchdocs=global_config.searchdocs,
-        )
-        
-        # Read current foamfiles from case directory for review context
+        # Reference retrieval and reading the current foamfiles (review context)
+        # are independent blocking calls, so overlap them off the event loop.
         await ctx.info("Reading OpenFOAM files for review context...")
-        from utils import read_case_foamfiles
-        foamfiles = read_case_foamfiles(request.case_dir)
+        references, foamfiles = await asyncio.gather(
+            asyncio.to_thread(
+                retrieve_references,
+                case_name=case_info["case_name"],
+                case_solver=case_info["case_solver"],
+                case_domain=case_info["case_domain"],
+                case_category=case_info["case_category"],
+                searchdocs=global_config.searchdocs,
+            ),
+            asyncio.to_thread(read_case_foamfiles, request.case_dir),
+        )
+        tutorial_reference = references[0]
         await ctx.info(f"Read {len(foamfiles.list_foamfile)} file(s) for review")
         
         # Review results - directly call review_error_logs
-        review_content, _ = review_error_logs(
+        review_content, _ = await asyncio.to_thread(
+            review_error_logs,
             tutorial_reference=tutorial_reference,
             foamfiles=foamfiles,
             error_logs=request.errors,
@@ -455,7 +461,42 @@ class ApplyFixesRequest(BaseModel):
 class ApplyFixesResponse(BaseModel):
     """Response from applying fixes."""
     updated_files: List[str] = Field(description="List of file paths that were updated")
-    status: str = Field(description="Fix application status ('ok' or 'no_changes')")
+    status: str = Field(description="Fix application status ('ok' or 'no_changes'; 'failed' for a failed item of apply_fixes_batch)")
+
+
+def _apply_fixes_sync(request: ApplyFixesRequest) -> ApplyFixesResponse:
+    """Validate one apply_fixes request, rewrite its files and report the updated paths."""
+    # Validate case directory exists
+    if not os.path.exists(request.case_dir):
+        raise ValueError(f"Case directory does not exist: {request.case_dir}")
+
+    # Validate review_analysis is provided
+    if not request.review_analysis or request.review_analysis.strip() == "":
+        raise ValueError(
+            "review_analysis is required. Please call the 'review' tool first "
+            "to get review analysis, then provide it to this tool."
+        )
+
+    # Directly call rewrite_files - it now handles file reading internally
+    from services.input_writer import rewrite_files
+
+    result = rewrite_files(
+        case_dir=request.case_dir,
+        error_logs=request.error_logs,
+        review_analysis=request.review_analysis,
+        rewrite_plan=None,
+        user_requirement=request.user_requirement
+        # foamfiles and dir_structure will be read automatically if None
+    )
+
+    # Extract written file paths
+    foamfile_list = getattr(result.get("foamfiles"), "list_foamfile", None) or []
+    written_files = [os.path.join(request.case_dir, f.folder_name, f.file_name) for f in foamfile_list]
+
+    return ApplyFixesResponse(
+        updated_files=written_files,
+        status="ok" if written_files else "no_changes"
+    )
 
 
 @mcp.tool(name="apply_fixes")
@@ -500,53 +541,72 @@ async def apply_fixes(
     """
     try:
         await ctx.info(f"Applying fixes for case directory: {request.case_dir}")
-        
-        # Validate case directory exists
-        if not os.path.exists(request.case_dir):
-            raise ValueError(f"Case directory does not exist: {request.case_dir}")
-        
-        # Validate review_analysis is provided
-        if not request.review_analysis or request.review_analysis.strip() == "":
-            raise ValueError(
-                "review_analysis is required. Please call the 'review' tool first "
-                "to get review analysis, then provide it to this tool."
-            )
-        
         await ctx.info("Rewriting OpenFOAM files based on review analysis...")
-        
-        # Directly call rewrite_files - it now handles file reading internally
-        from services.input_writer import rewrite_files
-        
-        result = rewrite_files(
-            case_dir=request.case_dir,
-            error_logs=request.error_logs,
-            review_analysis=request.review_analysis,
-            rewrite_plan=None,
-            user_requirement=request.user_requirement
-            # foamfiles and dir_structure will be read automatically if None
-        )
-        
-        # Extract written file paths
-        written_files = []
-        if result.get("foamfiles") and hasattr(result["foamfiles"], "list_foamfile"):
-            for foamfile in result["foamfiles"].list_foamfile:
-                file_path = os.path.join(request.case_dir, foamfile.folder_name, foamfile.file_name)
-                written_files.append(file_path)
-        
-        status = "ok" if written_files else "no_changes"
-        
-        await ctx.info(f"Successfully applied fixes. Updated {len(written_files)} file(s)")
-        
-        return ApplyFixesResponse(
-            updated_files=written_files,
-            status=status
-        )
+
+        response = await asyncio.to_thread(_apply_fixes_sync, request)
+
+        await ctx.info(f"Successfully applied fixes. Updated {len(response.updated_files)} file(s)")
+
+        return response
         
     except Exception as e:
         await ctx.error(f"Failed to apply fixes: {str(e)}")
         raise
 
 
+class ApplyFixesBatchRequest(BaseModel):
+    """Request to apply fixes to several OpenFOAM cases."""
+    requests: List[ApplyFixesRequest] = Field(description="One apply_fixes request per case directory")
+    max_concurrency: int = Field(default=4, ge=1, description="Maximum number of cases rewritten at the same time")
+
+
+class ApplyFixesBatchResponse(BaseModel):
+    """Response from applying fixes to several cases."""
+    results: List[ApplyFixesResponse] = Field(description="One result per request, in request order")
+
+
+@mcp.tool(name="apply_fixes_batch")
+async def apply_fixes_batch(
+    request: ApplyFixesBatchRequest,
+    ctx: Context
+) -> ApplyFixesBatchResponse:
+    """Apply fixes to several OpenFOAM cases concurrently.
+
+    Each item is handled exactly like the 'apply_fixes' tool, but up to
+    max_concurrency cases are rewritten at the same time, so their LLM calls
+    overlap instead of running one after another. The case directories must
+    be distinct. A failing item is reported with status 'failed' and does not
+    abort the others.
+
+    Args:
+        request: ApplyFixesBatchRequest containing:
+            - requests: List of ApplyFixesRequest items
+            - max_concurrency: Maximum number of cases rewritten at once (default 4)
+
+    Returns:
+        ApplyFixesBatchResponse with one ApplyFixesResponse per request
+    """
+    case_dirs = [os.path.abspath(r.case_dir) for r in request.requests]
+    if len(set(case_dirs)) != len(case_dirs):
+        raise ValueError("apply_fixes_batch requires distinct case directories")
+
+    await ctx.info(f"Applying fixes for {len(request.requests)} case(s), {request.max_concurrency} at a time")
+    semaphore = asyncio.Semaphore(request.max_concurrency)
+
+    async def apply_one(item: ApplyFixesRequest) -> ApplyFixesResponse:
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(_apply_fixes_sync, item)
+            except Exception as e:
+                await ctx.error(f"Failed to apply fixes for {item.case_dir}: {str(e)}")
+                return ApplyFixesResponse(updated_files=[], status="failed")
+
+    results = await asyncio.gather(*(apply_one(item) for item in request.requests))
+    updated = sum(len(r.updated_files) for r in results)
+    await ctx.info(f"Applied fixes to {len(results)} case(s). Updated {updated} file(s)")
+    return ApplyFixesBatchResponse(results=list(results))
+
+
 # ============================================================================
 # Tool: visualization
 # ============================================================================
@@ -1,12 +1,11 @@
 # runner_node.py
-from typing import List
-import os
-from pydantic import BaseModel, Field
-import re
+import logging
 
 from services.run_local import run_allrun_and_collect_errors
 from logger import log_review
 
+logger = logging.getLogger(__name__)
+
 
 def local_runner_node(state):
     """
@@ -23,16 +22,13 @@ def local_runner_node(state):
     error_logs = run_allrun_and_collect_errors(case_dir, max_time_limit)
 
     if len(error_logs) > 0:
-        print("Errors detected in the Allrun execution.")
+        logger.info("Errors detected in the Allrun execution.")
         log_review(str(error_logs), "error_logs")
     else:
-        print("Allrun executed successfully without errors.")
+        logger.info("Allrun executed successfully without errors.")
 
     print("</runner>")
 
-    # Return updated state
-    return {
-        **state,
-        "error_logs": error_logs
-    }
+    # Return only the updated key; LangGraph merges it into the state
+    return {"error_logs": error_logs}
         
\ No newline at end of file
@@ -13,6 +13,22 @@ def handle_standard_mesh(state, case_dir):
         "error_logs": []
     }
 
+# mesh_type (from the router) -> (routing message, handler(state, case_dir))
+_MESH_HANDLERS = {
+    "custom_mesh": (
+        "Custom mesh requested.",
+        lambda state, case_dir: copy_custom_mesh(state.get("custom_mesh_path"), state["user_requirement"], case_dir),
+    ),
+    "gmsh_mesh": (
+        "GMSH mesh requested.",
+        lambda state, case_dir: service_handle_gmsh_mesh(state, case_dir),
+    ),
+}
+_STANDARD_MESH_HANDLER = (
+    "Standard mesh generation.",
+    lambda state, case_dir: prepare_standard_mesh(state["user_requirement"], case_dir),
+)
+
 def meshing_node(state):
     """
     Meshing node: Handle different mesh scenarios based on user requirements.
@@ -27,8 +43,6 @@ def meshing_node(state):
       - mesh_commands: Commands needed for mesh processing
       - mesh_file_destination: Where the mesh file should be placed
     """
-    config = state["config"]
-    user_requirement = state["user_requirement"]
     case_dir = state["case_dir"]
     
     # Get mesh type from state (determined by router)
@@ -36,14 +50,8 @@ def meshing_node(state):
     
     # Handle mesh based on type determined by router
     print("<meshing>")
-    if mesh_type == "custom_mesh":
-        print("<mesh_routing>Custom mesh requested.</mesh_routing>")
-        result = copy_custom_mesh(state.get("custom_mesh_path"), user_requirement, case_dir)  # service
-    elif mesh_type == "gmsh_mesh":
-        print("<mesh_routing>GMSH mesh requested.</mesh_routing>")
-        result = service_handle_gmsh_mesh(state, case_dir)  # service
-    else:
-        print("<mesh_routing>Standard mesh generation.</mesh_routing>")
-        result = prepare_standard_mesh(user_requirement, case_dir)  # service
+    routing_message, handler = _MESH_HANDLERS.get(mesh_type, _STANDARD_MESH_HANDLER)
+    print(f"<mesh_routing>{routing_message}</mesh_routing>")
+    result = handler(state, case_dir)  # service
     print("</meshing>")
     return result
@@ -8,7 +8,7 @@ import shutil
 from utils import save_file, retrieve_faiss, parse_directory_structure, LLMService
 from services.plan import generate_simulation_plan
 from services import global_llm_service
-from router_func import llm_requires_custom_mesh, llm_requires_hpc, llm_requires_visualization
+from router_func import classify_requirements
 from logger import setup_logging
 
 class CaseSummaryPydantic(BaseModel):
@@ -42,6 +42,7 @@ def planner_node(state):
         case_stats=state["case_stats"],
         case_dir=getattr(config, "case_dir", ""),
         searchdocs=getattr(config, "searchdocs", 2),
+        use_cache=getattr(config, "llm_response_cache", False),
     )
     
     # Extract plan data
@@ -80,21 +81,19 @@ def planner_node(state):
     # Save reference file
     save_file(case_path_reference, f"{faiss_detailed}\n\n\n{allrun_reference}")
 
-    # Determine mesh type
-    mesh_type = llm_requires_custom_mesh(state)
-    if mesh_type == 1:
-        mesh_type_value = "custom_mesh"
+    # Make all routing decisions in one LLM call and cache them in the state,
+    # so the routers never have to ask again.
+    routing = classify_requirements(state)
+    mesh_type_value = routing["mesh_type"]
+    requires_hpc = routing["requires_hpc"]
+    requires_visualization = routing["requires_visualization"]
+    if mesh_type_value == "custom_mesh":
         print("<mesh_type>custom_mesh - Custom mesh requested.</mesh_type>")
-    elif mesh_type == 2:
-        mesh_type_value = "gmsh_mesh"
+    elif mesh_type_value == "gmsh_mesh":
         print("<mesh_type>gmsh_mesh - GMSH mesh requested.</mesh_type>")
     else:
-        mesh_type_value = "standard_mesh"
         print("<mesh_type>standard_mesh - Standard mesh generation.</mesh_type>")
 
-    # Cache routing decisions to avoid repeated LLM calls in routing.
-    requires_hpc = llm_requires_hpc(state)
-    requires_visualization = llm_requires_visualization(state)
     print(f"<routing_decisions>requires_hpc={requires_hpc}, requires_visualization={requires_visualization}</routing_decisions>")
     print("</planner>")
 
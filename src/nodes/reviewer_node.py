@@ -1,9 +1,11 @@
 # reviewer_node.py
-from pydantic import BaseModel, Field
-from typing import List
-from services.review import review_error_logs, generate_rewrite_plan
+import logging
+
+from services.review import review_and_plan
 from logger import log_review
 
+logger = logging.getLogger(__name__)
+
 
 def reviewer_node(state):
     """
@@ -12,16 +14,16 @@ def reviewer_node(state):
     """
     print("<reviewer>")
     if len(state["error_logs"]) == 0:
-        print("No error to review.")
+        logger.info("No error to review.")
         print("</reviewer>")
         return state
 
     # Log error logs to review.log
     log_review(str(state["error_logs"]), "error_logs")
 
-    # Stateless review via service
+    # Stateless review and rewrite planning via service, in a single LLM call
     history_text = state.get("history_text") or []
-    review_content, updated_history = review_error_logs(
+    review_content, updated_history, rewrite_plan, action = review_and_plan(
         tutorial_reference=state.get('tutorial_reference', ''),
         foamfiles=state.get('foamfiles'),
         error_logs=state.get('error_logs'),
@@ -31,21 +33,28 @@ def reviewer_node(state):
     )
 
     log_review(review_content, "review_analysis")
-
-    rewrite_plan = generate_rewrite_plan(
-        foamfiles=state.get('foamfiles'),
-        error_logs=state.get('error_logs', []),
-        review_analysis=review_content,
-        user_requirement=state.get('user_requirement', ''),
-    )
     log_review(str(rewrite_plan), "rewrite_plan")
+    logger.debug(
+        "Review planned changes to %d file(s): %s",
+        len(rewrite_plan.get("target_files", [])),
+        [item.get("file") for item in rewrite_plan.get("target_files", [])],
+    )
+
+    if action == "skip" and state.get("review_action") == "skip":
+        # The previous unchanged rerun already failed; a second one won't differ.
+        action = "rewrite"
 
+    print(f"<review_action>{action}</review_action>")
     print("</reviewer>")
 
-    return {
+    update = {
         "history_text": updated_history,
         "review_analysis": review_content,
         "rewrite_plan": rewrite_plan,
+        "review_action": action,
         "loop_count": state.get("loop_count", 0) + 1,
         "input_writer_mode": "rewrite",
     }
+    if action == "halt":
+        update["termination_reason"] = "reviewer_halted"
+    return update
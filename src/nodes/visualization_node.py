@@ -1,9 +1,12 @@
 # visualization_node.py
+import logging
 import os
 from services.visualization import (
-    ensure_foam_file,
+    build_plot_configs,
+    resolve_visualization_paths,
     generate_deterministic_pyvista_script,
     generate_pyvista_script,
+    is_unrecoverable_error,
     run_pyvista_script,
     fix_pyvista_script,
 )
@@ -11,6 +14,8 @@ from services.visualization import (
 
 # Routing should decide whether to enter this node (see router_func.llm_requires_visualization).
 
+logger = logging.getLogger(__name__)
+
 def _guess_primary_field(user_requirement: str) -> str:
     """Very small heuristic; keep deterministic and conservative."""
     if not user_requirement:
@@ -25,6 +30,27 @@ def _guess_primary_field(user_requirement: str) -> str:
         return "U"
     return "U"
 
+def _success_result(field_name: str, case_dir: str, output_image: str, script: str, used: str) -> dict:
+    return {
+        "plot_configs": build_plot_configs(field_name, output_image),
+        "plot_outputs": [output_image],
+        "visualization_summary": {
+            "total_plots_generated": 1,
+            "plot_types": ["pyvista"],
+            "fields_visualized": [field_name],
+            "output_directory": case_dir,
+            "pyvista_success": True,
+            "used": used,
+        },
+        "pyvista_visualization": {
+            "success": True,
+            "output_image": output_image,
+            "script": script,
+            "used": used,
+        },
+    }
+
+
 def visualization_node(state):
     """Visualization node: create a minimal PyVista screenshot for an OpenFOAM case.
 
@@ -43,7 +69,6 @@ def visualization_node(state):
     if not case_dir:
         print("</visualization>")
         return {
-            **state,
             "plot_configs": [],
             "plot_outputs": [],
             "visualization_summary": {"error": "Missing case_dir"},
@@ -52,168 +77,86 @@ def visualization_node(state):
 
     case_dir = os.path.abspath(case_dir)
     if not os.path.exists(case_dir):
-        print(f"Case directory does not exist: {case_dir}")
+        logger.warning("Case directory does not exist: %s", case_dir)
         print("</visualization>")
         return {
-            **state,
             "plot_configs": [],
             "plot_outputs": [],
             "visualization_summary": {"error": f"Case directory does not exist: {case_dir}"},
             "pyvista_visualization": {"success": False, "error": f"Case directory does not exist: {case_dir}"},
         }
 
-    foam_file = ensure_foam_file(case_dir)
+    paths = resolve_visualization_paths(case_dir)
+    foam_file = paths.foam_file
 
     max_loop = getattr(state.get("config"), "max_loop", 2)
+    persistent_worker = getattr(state.get("config"), "visualization_persistent_worker", False)
     timeout_s = 180
 
-    # Deterministic artifact path (relative to case_dir)
-    output_png_rel = "visualization.png"
-
     field_name = _guess_primary_field(user_requirement)
 
+    def run_script(script: str, filename: str):
+        return run_pyvista_script(
+            case_dir,
+            script,
+            filename=filename,
+            expected_png=paths.output_png,
+            timeout_s=timeout_s,
+            persistent_worker=persistent_worker,
+        )
+
     error_logs = []
 
     # Attempt 1: deterministic template (preferred)
     deterministic_script = generate_deterministic_pyvista_script(
         foam_file=foam_file,
-        output_png=output_png_rel,
+        output_png=paths.output_png,
         field_preference=field_name,
     )
-    success, output_image, errs = run_pyvista_script(
-        case_dir,
-        deterministic_script,
-        filename="visualization.py",
-        expected_png=output_png_rel,
-        timeout_s=timeout_s,
-    )
+    success, output_image, errs = run_script(deterministic_script, "visualization.py")
     if success and output_image:
-        plot_configs = [
-            {
-                "plot_type": "pyvista",
-                "field_name": field_name,
-                "time_step": "latest",
-                "output_format": "png",
-                "output_path": output_image,
-            }
-        ]
         print("</visualization>")
-        return {
-            **state,
-            "plot_configs": plot_configs,
-            "plot_outputs": [output_image],
-            "visualization_summary": {
-                "total_plots_generated": 1,
-                "plot_types": ["pyvista"],
-                "fields_visualized": [field_name],
-                "output_directory": case_dir,
-                "pyvista_success": True,
-                "used": "deterministic_template",
-            },
-            "pyvista_visualization": {
-                "success": True,
-                "output_image": output_image,
-                "script": deterministic_script,
-                "used": "deterministic_template",
-            },
-        }
+        return _success_result(field_name, case_dir, output_image, deterministic_script, "deterministic_template")
 
     error_logs.extend(errs)
+    logger.debug("Deterministic visualization template failed: %s", errs)
+    if is_unrecoverable_error(errs):
+        max_loop = 0
 
     # Fallback: LLM generate + self-correct loop (kept, but artifact path is deterministic)
     current_loop = 0
     while current_loop < max_loop:
         current_loop += 1
-        print(f"LLM visualization attempt {current_loop} of {max_loop}")
+        logger.info("LLM visualization attempt %d of %d", current_loop, max_loop)
 
         viz_script = generate_pyvista_script(case_dir, foam_file, user_requirement, error_logs[-2:])
-        success, output_image, errs = run_pyvista_script(
-            case_dir,
-            viz_script,
-            filename="visualization_llm.py",
-            expected_png=output_png_rel,
-            timeout_s=timeout_s,
-        )
+        success, output_image, errs = run_script(viz_script, "visualization_llm.py")
 
         if success and output_image:
-            plot_configs = [
-                {
-                    "plot_type": "pyvista",
-                    "field_name": field_name,
-                    "time_step": "latest",
-                    "output_format": "png",
-                    "output_path": output_image,
-                }
-            ]
             print("</visualization>")
-            return {
-                **state,
-                "plot_configs": plot_configs,
-                "plot_outputs": [output_image],
-                "visualization_summary": {
-                    "total_plots_generated": 1,
-                    "plot_types": ["pyvista"],
-                    "fields_visualized": [field_name],
-                    "output_directory": case_dir,
-                    "pyvista_success": True,
-                    "used": "llm_script",
-                },
-                "pyvista_visualization": {
-                    "success": True,
-                    "output_image": output_image,
-                    "script": viz_script,
-                    "used": "llm_script",
-                },
-            }
+            return _success_result(field_name, case_dir, output_image, viz_script, "llm_script")
 
         error_logs.extend(errs)
+        if is_unrecoverable_error(errs):
+            break
 
         if current_loop < max_loop:
             fixed_script = fix_pyvista_script(foam_file, viz_script, error_logs[-2:])
-            success, output_image, errs = run_pyvista_script(
-                case_dir,
-                fixed_script,
-                filename="visualization_fixed.py",
-                expected_png=output_png_rel,
-                timeout_s=timeout_s,
-            )
+            success, output_image, errs = run_script(fixed_script, "visualization_fixed.py")
             if success and output_image:
-                plot_configs = [
-                    {
-                        "plot_type": "pyvista",
-                        "field_name": field_name,
-                        "time_step": "latest",
-                        "output_format": "png",
-                        "output_path": output_image,
-                    }
-                ]
                 print("</visualization>")
-                return {
-                    **state,
-                    "plot_configs": plot_configs,
-                    "plot_outputs": [output_image],
-                    "visualization_summary": {
-                        "total_plots_generated": 1,
-                        "plot_types": ["pyvista"],
-                        "fields_visualized": [field_name],
-                        "output_directory": case_dir,
-                        "pyvista_success": True,
-                        "used": "llm_fixed_script",
-                    },
-                    "pyvista_visualization": {
-                        "success": True,
-                        "output_image": output_image,
-                        "script": fixed_script,
-                        "used": "llm_fixed_script",
-                    },
-                }
+                return _success_result(field_name, case_dir, output_image, fixed_script, "llm_fixed_script")
             error_logs.extend(errs)
+            if is_unrecoverable_error(errs):
+                break
 
-    error_message = f"Visualization failed after {max_loop} LLM attempts"
+    if is_unrecoverable_error(error_logs[-1:]):
+        error_message = "Visualization failed with an error no script change can fix"
+    else:
+        error_message = f"Visualization failed after {max_loop} LLM attempts"
     print(f"<visualization_error>{error_message}</visualization_error>")
     print("</visualization>")
     return {
-        **state,
         "plot_configs": [],
         "plot_outputs": [],
         "visualization_summary": {
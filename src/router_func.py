@@ -1,9 +1,206 @@
-from typing import TypedDict, List, Optional
+import functools
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict, List, Literal, Optional
+from pydantic import BaseModel, Field
 from config import Config
 from utils import LLMService, GraphState
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import Command
 
+logger = logging.getLogger(__name__)
+
+
+# Cheap pre-check: without any of these hints the requirement cannot ask for a
+# custom or gmsh mesh, so the classifier LLM call is skipped. A miss silently
+# falls back to blockMesh, so the hints cover the usual ways of referring to a
+# supplied mesh ("my mesh", "the attached mesh", "mesh is uploaded", "import
+# the mesh"); a false hit only costs the classifier call.
+_MESH_HINT_RE = re.compile(
+    r"\.(?:msh|stl|obj|unv|cgns|vtk|vtu)\b|\bgmsh\b|\bcustom[\s_-]*mesh|\bmesh[\s_-]*file"
+    r"|\b(?:my|our|your|their|own|external|existing|imported?|provided|supplied|given|attached|uploaded"
+    r"|included|accompanying|prepared|pre-?(?:built|generated|made))\s+(?:[\w-]+\s+){0,2}?mesh"
+    r"|\bmesh\s+(?:(?:is|was|has\s+been)\s+)?(?:attached|uploaded|provided|supplied|given|included)"
+    r"|\b(?:import|load|upload|read)\w*\s+(?:(?:a|an|the|this|that|my|our)\s+)?mesh",
+    re.IGNORECASE,
+)
+# Same idea for the HPC and visualization classifiers: both default to False,
+# so a requirement without any of these hints is decided without the LLM.
+# The visualization hints are deliberately broad (any wording that asks to see
+# a result), since a miss skips a request the LLM would have answered yes to;
+# a false hit only costs the classifier call. The HPC hints only name
+# schedulers and remote/cluster execution, not words such as "parallel" or
+# "nodes" that appear in ordinary CFD descriptions.
+_HPC_HINT_RE = re.compile(
+    r"\b(?:hpc|cluster|supercomput\w*|slurm|sbatch|srun|pbs|qsub|torque|lsf|bsub"
+    r"|job\s+(?:queue|scheduler|script|submission)|compute\s+nodes?"
+    r"|remote\s+(?:machine|server|system|host|cluster)|(?:parallel|distributed)\s+computing)\b",
+    re.IGNORECASE,
+)
+_VIZ_HINT_RE = re.compile(
+    r"\bvisual|\bplot|\brender|contour|streamline|vector\s*(?:field|plot)|paraview|pyvista"
+    r"|post-?\s*process|screenshot|snapshot|animat|\bimage|\bfigure|\bpicture|\bpng\b|\bjpe?g\b"
+    r"|\bshow|\bdisplay|\bdraw|\bgraph|\bchart|\bslice|\bview|\billustrat|\bsketch",
+    re.IGNORECASE,
+)
+
+# Classifier answers, matched case-insensitively without lowercasing the response.
+_MESH_ANSWER_RE = re.compile(r"\b(custom_mesh|gmsh_mesh)\b", re.IGNORECASE)
+_HPC_ANSWER_RE = re.compile(r"\bhpc_run\b", re.IGNORECASE)
+_VIZ_ANSWER_RE = re.compile(r"\byes_visualization\b", re.IGNORECASE)
+
+
+MESH_CLASSIFIER_SYSTEM_PROMPT = (
+    "You are an expert in OpenFOAM workflow analysis. "
+    "Analyze the user requirement to determine if they want to use a custom mesh file. "
+    "Look for keywords like: custom mesh, mesh file, .msh, .stl, .obj, gmsh, snappyHexMesh, "
+    "or any mention of importing/using external mesh files. "
+    "If the user explicitly mentions or implies they want to use a custom mesh file, return 'custom_mesh'. "
+    "If they want to use standard OpenFOAM mesh generation (blockMesh, snappyHexMesh with STL, etc.), return 'standard_mesh'. "
+    "Look for keywords like gmsh and determine if they want to create mesh using gmsh. If they want to create mesh using gmsh, return 'gmsh_mesh'. "
+    "Be conservative - if unsure, assume 'standard_mesh' unless clearly specified otherwise."
+    "Only return 'custom_mesh' or 'standard_mesh' or 'gmsh_mesh'. Don't return anything else."
+)
+# User templates keep the static instructions first and the requirement last,
+# so prompts share the longest possible prefix for provider-side caching.
+_MESH_CLASSIFIER_USER_TMPL = (
+    "Determine if the user wants to use a custom mesh file. "
+    "Return exactly 'custom_mesh' if they want to use a custom mesh file, "
+    "'standard_mesh' if they want standard OpenFOAM mesh generation or 'gmsh_mesh' if they want to create mesh using gmsh.\n\n"
+    "User requirement: {user_requirement}"
+)
+
+HPC_CLASSIFIER_SYSTEM_PROMPT = (
+    "You are an expert in OpenFOAM workflow analysis. "
+    "Analyze the user requirement to determine if they want to run the simulation on HPC (High Performance Computing) or locally. "
+    "Look for keywords like: HPC, cluster, supercomputer, SLURM, PBS, job queue, "
+    "parallel computing, distributed computing, or any mention of running on remote systems. "
+    "If the user explicitly mentions or implies they want to run on HPC/cluster, return 'hpc_run'. "
+    "If they want to run locally or don't specify, return 'local_run'. "
+    "Be conservative - if unsure, assume local run unless clearly specified otherwise."
+    "Only return 'hpc_run' or 'local_run'. Don't return anything else."
+)
+_HPC_CLASSIFIER_USER_TMPL = (
+    "return 'hpc_run' or 'local_run'\n\n"
+    "User requirement: {user_requirement}"
+)
+
+VISUALIZATION_CLASSIFIER_SYSTEM_PROMPT = (
+    "You are an expert in OpenFOAM workflow analysis. "
+    "Analyze the user requirement to determine if they explicitly want visualization/post-processing of results. "
+    "Signals include requests to: visualize/plot/render results, create images/figures, contours, vectors, streamlines, "
+    "Paraview/PyVista, post-processing, screenshots, or animations. "
+    "Return 'yes_visualization' ONLY if the user explicitly requests visualization. "
+    "If they do not mention visualization, or you are unsure, return 'no_visualization'. "
+    "Only return 'yes_visualization' or 'no_visualization'."
+)
+_VISUALIZATION_CLASSIFIER_USER_TMPL = (
+    "Return exactly: 'yes_visualization' or 'no_visualization'.\n\n"
+    "User requirement: {user_requirement}"
+)
+
+# classifier kind -> (system prompt, user prompt template)
+_CLASSIFIER_PROMPTS = {
+    "mesh": (MESH_CLASSIFIER_SYSTEM_PROMPT, _MESH_CLASSIFIER_USER_TMPL),
+    "hpc": (HPC_CLASSIFIER_SYSTEM_PROMPT, _HPC_CLASSIFIER_USER_TMPL),
+    "viz": (VISUALIZATION_CLASSIFIER_SYSTEM_PROMPT, _VISUALIZATION_CLASSIFIER_USER_TMPL),
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _classify(llm_service: LLMService, kind: str, user_requirement: str) -> str:
+    """Raw classifier response for one requirement.
+
+    The requirement does not change during a run, so each (service, kind,
+    requirement) is sent to the LLM once per process; with the LLM response
+    cache enabled it is also reused across runs.
+    """
+    logger.debug("Classifier %s: asking LLM for requirement %.100r", kind, user_requirement)
+    system_prompt, user_template = _CLASSIFIER_PROMPTS[kind]
+    user_prompt = user_template.format(user_requirement=user_requirement)
+    return llm_service.invoke(user_prompt, system_prompt, use_cache=True)
+
+
+# Mesh type names, indexed by the code llm_requires_custom_mesh returns.
+MESH_TYPES = ("standard_mesh", "custom_mesh", "gmsh_mesh")
+
+
+class RoutingDecision(BaseModel):
+    mesh_type: Literal["custom_mesh", "standard_mesh", "gmsh_mesh"] = Field(
+        description="custom_mesh: import a user mesh file; gmsh_mesh: create the mesh with gmsh; standard_mesh otherwise"
+    )
+    run_mode: Literal["hpc_run", "local_run"] = Field(description="hpc_run only if the user asks for HPC/cluster execution")
+    visualization: bool = Field(description="True only if the user explicitly asks for visualization of results")
+
+
+ROUTING_SYSTEM_PROMPT = (
+    "You are an expert in OpenFOAM workflow analysis. "
+    "Classify the user requirement along three independent axes and return strict JSON with exactly these keys: "
+    "{\"mesh_type\": \"custom_mesh\" | \"standard_mesh\" | \"gmsh_mesh\", \"run_mode\": \"hpc_run\" | \"local_run\", \"visualization\": true | false}. "
+    "mesh_type: 'custom_mesh' if the user explicitly mentions or implies using a custom mesh file (custom mesh, mesh file, .msh, .stl, .obj, "
+    "importing/using external mesh files); 'gmsh_mesh' if they want to create the mesh using gmsh; "
+    "'standard_mesh' for standard OpenFOAM mesh generation (blockMesh, snappyHexMesh with STL, etc.) or when unsure. "
+    "run_mode: 'hpc_run' if they explicitly mention or imply running on HPC/cluster (HPC, cluster, supercomputer, SLURM, PBS, job queue, "
+    "parallel or distributed computing on remote systems); 'local_run' if they want to run locally, don't specify, or you are unsure. "
+    "visualization: true ONLY if they explicitly request visualization/post-processing (visualize/plot/render results, images/figures, "
+    "contours, vectors, streamlines, Paraview/PyVista, screenshots, animations); false if not mentioned or unsure."
+)
+_ROUTING_USER_TMPL = (
+    "Return the JSON classification for this requirement.\n\n"
+    "User requirement: {user_requirement}"
+)
+
+
+@functools.lru_cache(maxsize=256)
+def _classify_all(llm_service: LLMService, user_requirement: str) -> RoutingDecision:
+    return llm_service.invoke(
+        _ROUTING_USER_TMPL.format(user_requirement=user_requirement),
+        ROUTING_SYSTEM_PROMPT,
+        pydantic_obj=RoutingDecision,
+        use_cache=True,
+    )
+
+
+def classify_requirements(state: GraphState) -> dict:
+    """Make all three routing decisions with one LLM call.
+
+    Returns the state keys the routers read: mesh_type ("custom_mesh",
+    "gmsh_mesh" or "standard_mesh"), requires_hpc and requires_visualization.
+    """
+    user_requirement = state["user_requirement"]
+    mesh_hint = bool(state.get("custom_mesh_path")) or bool(_MESH_HINT_RE.search(user_requirement))
+    hpc_hint = bool(_HPC_HINT_RE.search(user_requirement))
+    viz_hint = bool(_VIZ_HINT_RE.search(user_requirement))
+    if not (mesh_hint or hpc_hint or viz_hint):
+        logger.debug("Routing decided without LLM: no mesh/HPC/visualization hints in requirement %.100r", user_requirement)
+        return {"mesh_type": "standard_mesh", "requires_hpc": False, "requires_visualization": False}
+
+    try:
+        decision = _classify_all(state["llm_service"], user_requirement)
+    except Exception as e:
+        # The structured combined call failed (e.g. the provider returned no valid JSON):
+        # ask the single-purpose classifiers instead, concurrently since they are independent.
+        logger.warning("Combined routing classification failed (%s); using individual classifiers", e)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            mesh = executor.submit(llm_requires_custom_mesh, state)
+            hpc = executor.submit(llm_requires_hpc, state)
+            viz = executor.submit(llm_requires_visualization, state)
+            return {
+                "mesh_type": MESH_TYPES[mesh.result()],
+                "requires_hpc": hpc.result(),
+                "requires_visualization": viz.result(),
+            }
+    logger.debug(
+        "Routing decision %s (hints: mesh=%s hpc=%s viz=%s)",
+        decision, mesh_hint, hpc_hint, viz_hint,
+    )
+    return {
+        "mesh_type": decision.mesh_type if mesh_hint else "standard_mesh",
+        "requires_hpc": hpc_hint and decision.run_mode == "hpc_run",
+        "requires_visualization": viz_hint and decision.visualization,
+    }
+
 
 def llm_requires_custom_mesh(state: GraphState) -> int:
     """
@@ -16,33 +213,17 @@ def llm_requires_custom_mesh(state: GraphState) -> int:
         int: 1 if custom mesh is required, 2 if gmsh mesh is required, 0 otherwise
     """
     user_requirement = state["user_requirement"]
-    
-    system_prompt = (
-        "You are an expert in OpenFOAM workflow analysis. "
-        "Analyze the user requirement to determine if they want to use a custom mesh file. "
-        "Look for keywords like: custom mesh, mesh file, .msh, .stl, .obj, gmsh, snappyHexMesh, "
-        "or any mention of importing/using external mesh files. "
-        "If the user explicitly mentions or implies they want to use a custom mesh file, return 'custom_mesh'. "
-        "If they want to use standard OpenFOAM mesh generation (blockMesh, snappyHexMesh with STL, etc.), return 'standard_mesh'. "
-        "Look for keywords like gmsh and determine if they want to create mesh using gmsh. If they want to create mesh using gmsh, return 'gmsh_mesh'. "
-        "Be conservative - if unsure, assume 'standard_mesh' unless clearly specified otherwise."
-        "Only return 'custom_mesh' or 'standard_mesh' or 'gmsh_mesh'. Don't return anything else."
-    )
-    
-    user_prompt = (
-        f"User requirement: {user_requirement}\n\n"
-        "Determine if the user wants to use a custom mesh file. "
-        "Return exactly 'custom_mesh' if they want to use a custom mesh file, "
-        "'standard_mesh' if they want standard OpenFOAM mesh generation or 'gmsh_mesh' if they want to create mesh using gmsh."
-    )
-    
-    response = state["llm_service"].invoke(user_prompt, system_prompt)
-    if "custom_mesh" in response.lower():
-        return 1
-    elif "gmsh_mesh" in response.lower():
-        return 2
-    else:
+    if not state.get("custom_mesh_path") and not _MESH_HINT_RE.search(user_requirement):
         return 0
+    
+    response = _classify(state["llm_service"], "mesh", user_requirement)
+    answers = {answer.lower() for answer in _MESH_ANSWER_RE.findall(response)}
+    # custom_mesh wins when both are mentioned, wherever they appear.
+    if "custom_mesh" in answers:
+        return MESH_TYPES.index("custom_mesh")
+    if "gmsh_mesh" in answers:
+        return MESH_TYPES.index("gmsh_mesh")
+    return 0
 
 
 def llm_requires_hpc(state: GraphState) -> bool:
@@ -55,26 +236,10 @@ def llm_requires_hpc(state: GraphState) -> bool:
     Returns:
         bool: True if HPC execution is required, False otherwise
     """
-    user_requirement = state["user_requirement"]
-    
-    system_prompt = (
-        "You are an expert in OpenFOAM workflow analysis. "
-        "Analyze the user requirement to determine if they want to run the simulation on HPC (High Performance Computing) or locally. "
-        "Look for keywords like: HPC, cluster, supercomputer, SLURM, PBS, job queue, "
-        "parallel computing, distributed computing, or any mention of running on remote systems. "
-        "If the user explicitly mentions or implies they want to run on HPC/cluster, return 'hpc_run'. "
-        "If they want to run locally or don't specify, return 'local_run'. "
-        "Be conservative - if unsure, assume local run unless clearly specified otherwise."
-        "Only return 'hpc_run' or 'local_run'. Don't return anything else."
-    )
-    
-    user_prompt = (
-        f"User requirement: {user_requirement}\n\n"
-        "return 'hpc_run' or 'local_run'"
-    )
-    
-    response = state["llm_service"].invoke(user_prompt, system_prompt)
-    return "hpc_run" in response.lower()
+    if not _HPC_HINT_RE.search(state["user_requirement"]):
+        return False
+    response = _classify(state["llm_service"], "hpc", state["user_requirement"])
+    return _HPC_ANSWER_RE.search(response) is not None
 
 
 def llm_requires_visualization(state: GraphState) -> bool:
@@ -83,25 +248,19 @@ def llm_requires_visualization(state: GraphState) -> bool:
     Policy: ONLY visualize when the user explicitly asks for it.
     If uncertain, default to NO visualization (avoid expensive/flaky post-processing).
     """
-    user_requirement = state["user_requirement"]
+    if not _VIZ_HINT_RE.search(state["user_requirement"]):
+        return False
+    response = _classify(state["llm_service"], "viz", state["user_requirement"])
+    return _VIZ_ANSWER_RE.search(response) is not None
 
-    system_prompt = (
-        "You are an expert in OpenFOAM workflow analysis. "
-        "Analyze the user requirement to determine if they explicitly want visualization/post-processing of results. "
-        "Signals include requests to: visualize/plot/render results, create images/figures, contours, vectors, streamlines, "
-        "Paraview/PyVista, post-processing, screenshots, or animations. "
-        "Return 'yes_visualization' ONLY if the user explicitly requests visualization. "
-        "If they do not mention visualization, or you are unsure, return 'no_visualization'. "
-        "Only return 'yes_visualization' or 'no_visualization'."
-    )
-
-    user_prompt = (
-        f"User requirement: {user_requirement}\n\n"
-        "Return exactly: 'yes_visualization' or 'no_visualization'."
-    )
 
-    response = state["llm_service"].invoke(user_prompt, system_prompt)
-    return "yes_visualization" in response.lower()
+def _requires_visualization(state: GraphState) -> bool:
+    """Planner-cached visualization decision; classified (and memoized in state) only if missing."""
+    requires_visualization = state.get("requires_visualization")
+    if requires_visualization is None:
+        requires_visualization = llm_requires_visualization(state)
+        state["requires_visualization"] = requires_visualization
+    return requires_visualization
 
 
 def route_after_planner(state: GraphState):
@@ -109,7 +268,10 @@ def route_after_planner(state: GraphState):
     Route after planner node based on whether user wants custom mesh.
     For current version, if user wants custom mesh, user should be able to provide a path to the mesh file.
     """
-    mesh_type = state.get("mesh_type", "standard_mesh")
+    mesh_type = state.get("mesh_type")
+    if mesh_type is None:
+        mesh_type = MESH_TYPES[llm_requires_custom_mesh(state)]
+        state["mesh_type"] = mesh_type
     if mesh_type == "custom_mesh":
         print("<router>Custom mesh requested. Routing to meshing node.</router>")
         return "meshing"
@@ -142,26 +304,26 @@ def route_after_runner(state: GraphState):
     if state.get("error_logs") and len(state["error_logs"]) > 0:
         return "reviewer"
 
-    requires_visualization = state.get("requires_visualization")
-    if requires_visualization is None:
-        requires_visualization = llm_requires_visualization(state)
-        state["requires_visualization"] = requires_visualization
-
-    if requires_visualization:
+    if _requires_visualization(state):
         return "visualization"
     return END
 
 def route_after_reviewer(state: GraphState):
     loop_count = state.get("loop_count", 0)
     max_loop = state["config"].max_loop
+    review_action = state.get("review_action") or "rewrite"
+    if review_action == "halt":
+        print("<router>Reviewer found no file-level fix. Ending workflow.</router>")
+        return "visualization" if _requires_visualization(state) else END
+
     if loop_count >= max_loop:
         print(f"<router>Maximum loop count ({max_loop}) reached. Ending workflow.</router>")
         state["termination_reason"] = "max_review_loop_reached"
-        requires_visualization = state.get("requires_visualization")
-        if requires_visualization is None:
-            requires_visualization = llm_requires_visualization(state)
-            state["requires_visualization"] = requires_visualization
-        return "visualization" if requires_visualization else END
+        return "visualization" if _requires_visualization(state) else END
+
+    if review_action == "skip":
+        print(f"<router>Loop {loop_count}: Reviewer judged the error transient; rerunning without changes.</router>")
+        return route_after_input_writer(state)
 
     print(f"<router>Loop {loop_count}: Continuing to fix errors.</router>")
     return "input_writer"
@@ -1,20 +1,118 @@
+import functools
+import logging
 import os
 import re
 from typing import Dict, List, Any, Optional, Callable
 import shutil
-from utils import save_file, parse_context, retrieve_faiss, FoamPydantic, FoamfilePydantic, scan_case_directory, read_case_foamfiles, read_file
+from pydantic import BaseModel, Field
+from utils import save_file, save_files, AsyncArtifactWriter, parse_context, retrieve_faiss_batch, FoamPydantic, FoamfilePydantic, scan_case_directory, read_case_foamfiles, read_file, apply_unified_diff, serialize_foamfiles
 from . import global_llm_service
 
+logger = logging.getLogger(__name__)
+
+
+# Code block of the Allrun response; an optional bash/sh language tag is dropped.
+_ALLRUN_RE = re.compile(r'```(?:bash|shell|sh)?[ \t]*\n?(.*?)```', re.DOTALL)
+
+
+_ALLRUN_LANG_TAGS = {"", "bash", "shell", "sh"}
+
+
+def parse_allrun(text: str) -> str:
+    # Linear scan for the first fenced block; the regex only handles the
+    # single-line "```bash cmd```" form, where the tag cannot be split off a line.
+    start = text.find("```")
+    if start < 0:
+        return text
+    end = text.find("```", start + 3)
+    if end < 0:
+        return text
+    body = text[start + 3:end]
+    first_line, newline, rest = body.partition("\n")
+    if not newline:
+        match = _ALLRUN_RE.search(text)
+        return match.group(1).strip() if match else body.strip()
+    if first_line.strip() in _ALLRUN_LANG_TAGS:
+        body = rest
+    return body.strip()
+
+
+@functools.lru_cache(maxsize=8)
+def retrieve_commands(command_path: str) -> str:
+    """Return the command list file as a "[cmd1, cmd2, ...]" string (cached per path)."""
+    with open(command_path, 'r') as file:
+        commands = file.read().split()
+    return "[" + ", ".join(commands) + "]"
+
+
+# System prompt for file generation. The instructions, the user requirement and
+# the similar-case reference are the same for every file of a case, so the whole
+# system prompt is one cacheable prefix (the reference makes it long enough for
+# Anthropic's 1024-token caching minimum); everything that varies per file goes
+# at the end of the user prompt.
+_SYSTEM_PROMPT_PREFIX = (
+    "You are an expert in OpenFOAM simulation and numerical modeling. "
+    "Your task is to generate a complete and functional OpenFOAM file. "
+    "Ensure all required values are present and match with the files content already generated."
+    "Before finalizing the output, ensure:\n"
+    "- All necessary fields exist (e.g., if `nu` is defined in `constant/transportProperties`, it must be used correctly in `0/U`).\n"
+    "- Cross-check field names between different files to avoid mismatches.\n"
+    "- Ensure units and dimensions are correct** for all physical variables.\n"
+    "- Ensure case solver settings are consistent with the user's requirements.\n"
+    "Provide only the code—no explanations, comments, or additional text.\n"
+)
+_FILE_TARGET_TEMPLATE = (
+    "The file to generate is named: <file_name>{file_name}</file_name> within the <folder_name>{folder_name}</folder_name> directory. "
+    "Available solvers are: {case_solver}."
+)
+
+
+class FoamfilePatchPydantic(BaseModel):
+    file_name: str = Field(description="Name of the OpenFOAM input file")
+    folder_name: str = Field(description="Folder where the foamfile is stored")
+    patch: str = Field(description="Unified diff against the current content of the file")
+
+
+class FoamPatchPydantic(BaseModel):
+    list_foamfile_patch: List[FoamfilePatchPydantic] = Field(description="List of patches to OpenFOAM files")
+
+
+PATCH_REWRITE_SYSTEM_PROMPT = (
+    "You are an expert in OpenFOAM simulation and numerical modeling. "
+    "Your task is to modify OpenFOAM files to fix the reported error. "
+    "Please do not propose solutions that require modifying any parameters declared in the user requirement, try other approaches instead. "
+    "You will receive a rewrite_plan. Follow it strictly: only modify files listed in rewrite_plan.target_files and apply only the requested changes. "
+    "Do not modify files outside the plan. "
+    "For each modified file return a unified diff against the current file content shown in <foamfiles>, in JSON format: "
+    "list of foamfile patch: [{file_name: 'file_name', folder_name: 'folder_name', patch: 'unified diff'}]. "
+    "Each patch must consist of @@ hunks whose context and removed lines are copied exactly from the current file, "
+    "with at least two lines of unchanged context around every change. "
+    "Ensure your response includes only modified files with no extra text, as it will be parsed using Pydantic."
+)
+
+
+def _render_foamfile(foamfile: FoamfilePydantic) -> str:
+    """Render a generated file for use as cross-file context in later prompts."""
+    return (
+        f"<file folder_name=\"{foamfile.folder_name}\" file_name=\"{foamfile.file_name}\">\n"
+        f"{foamfile.content}\n</file>"
+    )
+
+
+_FOLDER_PRIORITY = {"system": 0, "constant": 1, "0": 2}
+_NUM_PRIORITY_TIERS = 4
+
 
 def compute_priority(subtask):
-    if subtask["folder_name"] == "system":
-        return 0
-    elif subtask["folder_name"] == "constant":
-        return 1
-    elif subtask["folder_name"] == "0":
-        return 2
-    else:
-        return 3
+    return _FOLDER_PRIORITY.get(subtask["folder_name"], 3)
+
+
+def partition_by_priority(subtasks: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+    """Split subtasks into the system / constant / 0 / other tiers, keeping their order."""
+    buckets = [[] for _ in range(_NUM_PRIORITY_TIERS)]
+    for subtask in subtasks:
+        buckets[compute_priority(subtask)].append(subtask)
+    return buckets
 
 
 def initial_write(
@@ -33,6 +131,7 @@ def initial_write(
     similar_case_advice: Optional[Any] = None,
     reuse_generated_dir: str = "",
     progress_callback: Optional[Callable[[int, int, str], None]] = None,
+    config: Optional[Any] = None,
 ) -> Dict[str, Any]:
     """
     Generate OpenFOAM files from scratch based on user requirements and subtasks.
@@ -56,6 +155,8 @@ def initial_write(
         mesh_commands (List[str], optional): Custom mesh commands. Defaults to None.
         database_path (str, optional): Path to FAISS database for command lookup. Defaults to "".
         searchdocs (int, optional): Number of documents to search for commands. Defaults to 2.
+        config (Config, optional): Caller's configuration; the parallel generation modes build
+            their per-file LLM clients from it. Defaults to a fresh Config().
     
     Returns:
         Dict[str, Any]: Contains:
@@ -91,83 +192,81 @@ def initial_write(
             except Exception:
                 pass
 
-    if generation_mode not in {"sequential_dependency", "parallel_no_context"}:
+    if generation_mode not in {"sequential_dependency", "tiered_dependency", "parallel_no_context"}:
         raise ValueError(
             f"Unsupported generation_mode: {generation_mode}. "
-            "Expected one of: sequential_dependency, parallel_no_context"
+            "Expected one of: sequential_dependency, tiered_dependency, parallel_no_context"
         )
 
-    subtasks = sorted(subtasks, key=compute_priority)
+    tiers = partition_by_priority(subtasks)
+    subtasks = [subtask for tier in tiers for subtask in tier]
     written_files = []
+    # Rendered context of written_files, grown by one entry per generated file.
+    written_files_repr: List[str] = []
     dir_structure = {}
 
-    # System prompt for file generation
-    INITIAL_WRITE_SYSTEM_PROMPT = (
-        "You are an expert in OpenFOAM simulation and numerical modeling."
-        f"Your task is to generate a complete and functional file named: <file_name>{{file_name}}</file_name> within the <folder_name>{{folder_name}}</folder_name> directory. "
-        "Ensure all required values are present and match with the files content already generated."
-        "Before finalizing the output, ensure:\n"
-        "- All necessary fields exist (e.g., if `nu` is defined in `constant/transportProperties`, it must be used correctly in `0/U`).\n"
-        "- Cross-check field names between different files to avoid mismatches.\n"
-        "- Ensure units and dimensions are correct** for all physical variables.\n"
-        f"- Ensure case solver settings are consistent with the user's requirements. Available solvers are: {{case_solver}}.\n"
-        "Provide only the code—no explanations, comments, or additional text."
-    )
-
-    def _build_prompts(file_name: str, folder_name: str, written_files_ctx: List[FoamfilePydantic]) -> tuple[str, str]:
-        code_system_prompt = INITIAL_WRITE_SYSTEM_PROMPT.format(
-            file_name=file_name,
-            folder_name=folder_name,
-            case_solver=case_solver,
+    advice_text = ""
+    if isinstance(similar_case_advice, dict):
+        advice_text = (
+            f"Similar case match level: {similar_case_advice.get('match_level')}\n"
+            f"Use scope: {similar_case_advice.get('use_scope')}\n"
+            f"Advice: {similar_case_advice.get('advice')}\n"
         )
+    elif similar_case_advice:
+        advice_text = str(similar_case_advice)
 
-        advice_text = ""
-        if isinstance(similar_case_advice, dict):
-            advice_text = (
-                f"Similar case match level: {similar_case_advice.get('match_level')}\n"
-                f"Use scope: {similar_case_advice.get('use_scope')}\n"
-                f"Advice: {similar_case_advice.get('advice')}\n"
-            )
-        elif similar_case_advice:
-            advice_text = str(similar_case_advice)
+    similar_ref_block = (
+        f"Refer to the following similar case file content if helpful:\n<similar_case_reference>{tutorial_reference}</similar_case_reference>\n"
+        if tutorial_reference else "No suitable similar case was found for this domain.\n"
+    )
 
-        similar_ref_block = (
-            f"Refer to the following similar case file content if helpful:\n<similar_case_reference>{tutorial_reference}</similar_case_reference>\n"
-            if tutorial_reference else "No suitable similar case was found for this domain.\n"
-        )
+    # Shared by every file of this case, so it is sent as the cacheable system prefix.
+    code_system_prompt = (
+        _SYSTEM_PROMPT_PREFIX
+        + f"User requirement: {user_requirement}\n"
+        + similar_ref_block
+        + advice_text
+        + "If the similar case is a weak match, do not copy it blindly. Use it only where it is consistent with the user requirement. "
+        "Just modify the necessary parts to make the file complete and functional. "
+        "Please ensure that the generated file is complete, functional, and logically sound. "
+        "Additionally, apply your domain expertise to verify that all numerical values are consistent with the user's requirements, maintaining accuracy and coherence. "
+        "When generating controlDict, do not include anything to preform post processing. Just include the necessary settings to run the simulation."
+    )
 
-        code_user_prompt = (
-            f"User requirement: {user_requirement}\n"
-            f"{similar_ref_block}"
-            f"{advice_text}"
-            "If the similar case is a weak match, do not copy it blindly. Use it only where it is consistent with the user requirement. "
-            "Just modify the necessary parts to make the file complete and functional."
-            "Please ensure that the generated file is complete, functional, and logically sound."
-            "Additionally, apply your domain expertise to verify that all numerical values are consistent with the user's requirements, maintaining accuracy and coherence."
-            "When generating controlDict, do not include anything to preform post processing. Just include the necessary settings to run the simulation."
-        )
+    def _build_prompts(file_name: str, folder_name: str, written_files_ctx: str) -> tuple[str, str]:
+        code_user_prompt = ""
 
         if file_name == "fvSolution":
             code_user_prompt += (
-                "\n\nCRITICAL for transient pressure-velocity coupling solvers using PISO/PIMPLE: "
+                "CRITICAL for transient pressure-velocity coupling solvers using PISO/PIMPLE: "
                 "the solvers dictionary must include matching Final solver entries for fields used on the final correction. "
                 "For example, if p is defined, include pFinal { $p; relTol 0; }; "
                 "if U is defined, include UFinal { $U; relTol 0; }. "
                 "For grouped regex entries, use the matching grouped Final entry, e.g. "
                 "\"(U|k|epsilon)Final\" { $U; relTol 0; }. "
                 "Do not emit placeholder text such as $<field>; in the generated file. "
-                "Also ensure the PIMPLE/PISO sub-dictionary matches the selected solver."
+                "Also ensure the PIMPLE/PISO sub-dictionary matches the selected solver.\n\n"
             )
 
-        if generation_mode == "sequential_dependency" and written_files_ctx:
+        if generation_mode != "parallel_no_context" and written_files_ctx:
             code_user_prompt += (
-                f"The following are files content already generated: {str(written_files_ctx)}\n\n\n"
-                "You should ensure that the new file is consistent with the previous files. Such as boundary conditions, mesh settings, etc."
+                f"The following are files content already generated:\n{written_files_ctx}\n\n\n"
+                "You should ensure that the new file is consistent with the previous files. Such as boundary conditions, mesh settings, etc.\n\n"
             )
 
+        # The target file goes last, so everything before it stays a shared prefix.
+        code_user_prompt += _FILE_TARGET_TEMPLATE.format(
+            file_name=file_name,
+            folder_name=folder_name,
+            case_solver=case_solver,
+        )
         return code_user_prompt, code_system_prompt
 
-    def _generate_one(subtask: Dict[str, str], written_files_ctx: List[FoamfilePydantic]) -> FoamfilePydantic:
+    # Generated files are written in the background; the ``with`` block below
+    # flushes them before the foamfiles are returned.
+    artifact_writer = AsyncArtifactWriter()
+
+    def _generate_one(subtask: Dict[str, str], written_files_ctx: str) -> FoamfilePydantic:
         file_name = subtask["file_name"]
         folder_name = subtask["folder_name"]
         if not file_name or not folder_name:
@@ -175,31 +274,34 @@ def initial_write(
 
         # Target output path (this run)
         file_path = os.path.join(case_dir, folder_name, file_name)
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
         # Optional reuse: if a pre-generated file exists, copy it into output and
         # treat it as a written file (also included in context for subsequent generations).
         if reuse_generated_dir:
             reuse_src = os.path.join(reuse_generated_dir, folder_name, file_name)
             if os.path.exists(reuse_src):
-                print(f"Reusing generated file: {reuse_src}")
+                logger.info("Reusing generated file: %s", reuse_src)
                 shutil.copy2(reuse_src, file_path)
                 reused_content = read_file(reuse_src)
                 return FoamfilePydantic(file_name=file_name, folder_name=folder_name, content=reused_content)
 
         code_user_prompt, code_system_prompt = _build_prompts(file_name, folder_name, written_files_ctx)
 
-        if generation_mode == "parallel_no_context":
-            # Avoid shared global LLM instance in parallel mode.
+        if generation_mode != "sequential_dependency":
+            # Avoid shared global LLM instance in parallel modes.
             from utils import LLMService
             from config import Config
-            llm = LLMService(Config())
-            generation_response = llm.invoke(code_user_prompt, code_system_prompt)
+            llm = LLMService(config if config is not None else Config())
+            generation_response = llm.invoke(
+                code_user_prompt, code_system_prompt, cacheable_system_prefix=code_system_prompt
+            )
         else:
-            generation_response = global_llm_service.invoke(code_user_prompt, code_system_prompt)
+            generation_response = global_llm_service.invoke(
+                code_user_prompt, code_system_prompt, cacheable_system_prefix=code_system_prompt
+            )
 
         code_context = parse_context(generation_response)
-        save_file(file_path, code_context)
+        artifact_writer.submit(file_path, code_context, create_dirs=False)
         return FoamfilePydantic(file_name=file_name, folder_name=folder_name, content=code_context)
 
     # Build dir_structure upfront (deterministic ordering) and generate files
@@ -210,56 +312,90 @@ def initial_write(
             dir_structure[folder_name] = []
         dir_structure[folder_name].append(file_name)
 
+    # Create each target folder once instead of once per generated file.
+    needed_dirs = {
+        os.path.dirname(os.path.join(case_dir, s["folder_name"], s["file_name"]))
+        for s in subtasks if s.get("folder_name") and s.get("file_name")
+    }
+    for d in needed_dirs:
+        os.makedirs(d, exist_ok=True)
+
     total_steps = len(subtasks) + (2 if database_path else 0)
     _report_progress(0, total_steps, f"Starting file generation for {len(subtasks)} files")
 
-    if generation_mode == "parallel_no_context":
-        print("<generation_mode>parallel_no_context (no cross-file context)</generation_mode>")
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-        import threading
-
-        # Parallelize all file generations; keep output order consistent with sorted subtasks.
-        results: List[Optional[FoamfilePydantic]] = [None] * len(subtasks)
-        completed_count = 0
-        count_lock = threading.Lock()
-        with ThreadPoolExecutor(max_workers=min(32, max(4, len(subtasks)))) as ex:
-            future_map = {
-                ex.submit(_generate_one, subtasks[i], []): i
-                for i in range(len(subtasks))
-            }
-            for fut in as_completed(future_map):
-                i = future_map[fut]
-                results[i] = fut.result()
-                with count_lock:
+    with artifact_writer:
+        if generation_mode == "parallel_no_context":
+            print("<generation_mode>parallel_no_context (no cross-file context)</generation_mode>")
+            from concurrent.futures import ThreadPoolExecutor, as_completed
+            import threading
+
+            # Parallelize all file generations; keep output order consistent with sorted subtasks.
+            results: List[Optional[FoamfilePydantic]] = [None] * len(subtasks)
+            completed_count = 0
+            count_lock = threading.Lock()
+            with ThreadPoolExecutor(max_workers=min(32, max(4, len(subtasks)))) as ex:
+                future_map = {
+                    ex.submit(_generate_one, subtasks[i], ""): i
+                    for i in range(len(subtasks))
+                }
+                for fut in as_completed(future_map):
+                    i = future_map[fut]
+                    results[i] = fut.result()
+                    with count_lock:
+                        completed_count += 1
+                        _report_progress(
+                            completed_count, total_steps,
+                            f"Generated {subtasks[i]['file_name']} in {subtasks[i]['folder_name']} (parallel)"
+                        )
+
+            written_files.extend([r for r in results if r is not None])
+
+        elif generation_mode == "tiered_dependency":
+            print("<generation_mode>tiered_dependency (parallel within system/constant/0/other tiers)</generation_mode>")
+            from concurrent.futures import ThreadPoolExecutor
+
+            # Files of one tier are generated concurrently and all see the files of
+            # the previous tiers, so e.g. 0/U still sees constant/transportProperties.
+            completed_count = 0
+            for tier in tiers:
+                if not tier:
+                    continue
+                for subtask in tier:
+                    print(f"<generating_file>{subtask['file_name']} in folder: {subtask['folder_name']}</generating_file>")
+                prior_files_ctx = "\n".join(written_files_repr)
+                with ThreadPoolExecutor(max_workers=min(32, len(tier))) as ex:
+                    tier_results = list(ex.map(lambda s: _generate_one(s, prior_files_ctx), tier))
+                written_files.extend(tier_results)
+                written_files_repr.extend(_render_foamfile(f) for f in tier_results)
+                for subtask in tier:
                     completed_count += 1
                     _report_progress(
                         completed_count, total_steps,
-                        f"Generated {subtasks[i]['file_name']} in {subtasks[i]['folder_name']} (parallel)"
+                        f"Generated {subtask['file_name']} in {subtask['folder_name']} (tiered)"
                     )
 
-        written_files.extend([r for r in results if r is not None])
+        else:
+            print("<generation_mode>sequential_dependency</generation_mode>")
+            for idx, subtask in enumerate(subtasks):
+                file_name = subtask["file_name"]
+                folder_name = subtask["folder_name"]
+                print(f"<generating_file>{file_name} in folder: {folder_name}</generating_file>")
+                foamfile = _generate_one(subtask, "\n".join(written_files_repr))
+                written_files.append(foamfile)
+                written_files_repr.append(_render_foamfile(foamfile))
+                _report_progress(idx + 1, total_steps, f"Generated {file_name} in {folder_name}")
+
+        # Generate Allrun script if database_path is provided
+        if database_path:
+            allrun_result = build_allrun(
+                case_dir, database_path, searchdocs, dir_structure, case_info,
+                allrun_reference, mesh_type, mesh_commands or [], user_requirement,
+                progress_callback=progress_callback,
+                progress_offset=len(subtasks),
+                total_steps=total_steps,
+            )
+            written_files.append(FoamfilePydantic(file_name="Allrun", folder_name=case_dir, content=allrun_result["allrun_script"]))
 
-    else:
-        print("<generation_mode>sequential_dependency</generation_mode>")
-        for idx, subtask in enumerate(subtasks):
-            file_name = subtask["file_name"]
-            folder_name = subtask["folder_name"]
-            print(f"<generating_file>{file_name} in folder: {folder_name}</generating_file>")
-            foamfile = _generate_one(subtask, written_files)
-            written_files.append(foamfile)
-            _report_progress(idx + 1, total_steps, f"Generated {file_name} in {folder_name}")
-    
-    # Generate Allrun script if database_path is provided
-    if database_path:
-        allrun_result = build_allrun(
-            case_dir, database_path, searchdocs, dir_structure, case_info,
-            allrun_reference, mesh_type, mesh_commands or [], user_requirement,
-            progress_callback=progress_callback,
-            progress_offset=len(subtasks),
-            total_steps=total_steps,
-        )
-        written_files.append(FoamfilePydantic(file_name="Allrun", folder_name=case_dir, content=allrun_result["allrun_script"]))
-    
     foamfiles = FoamPydantic(list_foamfile=written_files)
     print("</initial_write_service>")
     return {"dir_structure": dir_structure, "foamfiles": foamfiles}
@@ -324,11 +460,6 @@ def build_allrun(
     from pydantic import BaseModel, Field
     from typing import List
     
-    # Parse allrun helper function
-    def parse_allrun(text: str) -> str:
-        match = re.search(r'```(.*?)```', text, re.DOTALL)
-        return match.group(1).strip() if match else text
-    
     # CommandsPydantic class for structured response
     class CommandsPydantic(BaseModel):
         commands: List[str] = Field(description="List of commands")
@@ -336,9 +467,7 @@ def build_allrun(
     # Retrieve commands from file
     command_path = f"{database_path}/raw/openfoam_commands.txt"
     try:
-        with open(command_path, 'r') as file:
-            commands = file.readlines()
-        commands = f"[{', '.join([c.strip() for c in commands])}]"
+        commands = retrieve_commands(command_path)
     except (FileNotFoundError, IOError) as e:
         raise ValueError(f"Could not read commands file {command_path}: {e}")
 
@@ -346,7 +475,7 @@ def build_allrun(
     mesh_commands_info = ""
     if mesh_type == "custom_mesh" and mesh_commands:
         mesh_commands_info = f"\nCustom mesh commands to include: {mesh_commands}"
-        print(f"Including custom mesh commands: {mesh_commands}")
+        logger.info("Including custom mesh commands: %s", mesh_commands)
 
     # Command generation system prompt
     command_system_prompt = (
@@ -378,17 +507,14 @@ def build_allrun(
             pass
 
     if len(command_response.commands) == 0:
-        print("Failed to generate commands.")
+        logger.error("Failed to generate commands.")
         raise ValueError("Failed to generate commands.")
 
-    print(f"Need {len(command_response.commands)} commands.")
+    logger.info("Need %d commands.", len(command_response.commands))
     
     # Get command help from FAISS
-    commands_help = []
-    for command in command_response.commands:
-        command_help = retrieve_faiss("openfoam_command_help", command, topk=searchdocs)
-        commands_help.append(command_help[0]['full_content'])
-    commands_help = "\n".join(commands_help)
+    command_helps = retrieve_faiss_batch("openfoam_command_help", command_response.commands, topk=searchdocs)
+    commands_help = "\n".join(hits[0]['full_content'] for hits in command_helps)
 
     # Allrun generation system prompt
     allrun_system_prompt = (
@@ -445,7 +571,8 @@ def rewrite_files(
     rewrite_plan: Optional[Dict[str, Any]],
     user_requirement: str,
     foamfiles: Optional[Any] = None,
-    dir_structure: Optional[Dict[str, List[str]]] = None
+    dir_structure: Optional[Dict[str, List[str]]] = None,
+    rewrite_protocol: str = "full_content",
 ) -> Dict[str, Any]:
     """
     Rewrite OpenFOAM files based on error analysis and reviewer suggestions.
@@ -466,6 +593,10 @@ def rewrite_files(
                                    If None, will be read from case_dir.
         dir_structure (Optional[Dict[str, List[str]]]): Current directory structure.
                                                         If None, will be scanned from case_dir.
+        rewrite_protocol (str, optional): "full_content" to have the LLM return complete files,
+            or "unified_diff" to have it return patches against the current content. Files whose
+            patch does not apply cleanly are regenerated with the full-content protocol.
+            Defaults to "full_content".
     
     Returns:
         Dict[str, Any]: Contains:
@@ -498,12 +629,12 @@ def rewrite_files(
     
     # Read directory structure if not provided
     if dir_structure is None:
-        print(f"Scanning directory structure from: {case_dir}")
+        logger.debug("Scanning directory structure from: %s", case_dir)
         dir_structure = scan_case_directory(case_dir)
     
     # Read foamfiles if not provided
     if foamfiles is None:
-        print(f"Reading OpenFOAM files from: {case_dir}")
+        logger.debug("Reading OpenFOAM files from: %s", case_dir)
         foamfiles = read_case_foamfiles(case_dir, dir_structure)
     
     from utils import FoamPydantic, FoamfilePydantic  # local import to avoid cycles
@@ -520,17 +651,72 @@ def rewrite_files(
         "Ensure your response includes only modified file content with no extra text, as it will be parsed using Pydantic."
     )
 
-    rewrite_user_prompt = (
-        f"<foamfiles>{str(foamfiles)}</foamfiles>\n"
-        f"<error_logs>{error_logs}</error_logs>\n"
-        f"<reviewer_analysis>{review_analysis}</reviewer_analysis>\n"
-        f"<rewrite_plan>{rewrite_plan}</rewrite_plan>\n\n"
-        f"<user_requirement>{user_requirement}</user_requirement>\n\n"
-        "Please update OpenFOAM files according to rewrite_plan only. "
-        "Only include files from rewrite_plan.target_files in your output."
-    )
+    if rewrite_protocol not in {"full_content", "unified_diff"}:
+        raise ValueError(
+            f"Unsupported rewrite_protocol: {rewrite_protocol}. "
+            "Expected one of: full_content, unified_diff"
+        )
 
-    response = global_llm_service.invoke(rewrite_user_prompt, rewrite_system_prompt, pydantic_obj=FoamPydantic)
+    foamfiles_list = []
+    if foamfiles and hasattr(foamfiles, "list_foamfile") and foamfiles.list_foamfile:
+        foamfiles_list = list(foamfiles.list_foamfile)
+
+    def _full_content_rewrite(only_files: Optional[List[str]] = None) -> List[FoamfilePydantic]:
+        foamfiles_text = serialize_foamfiles(foamfiles)
+        rewrite_user_prompt = (
+            f"<foamfiles>{foamfiles_text}</foamfiles>\n"
+            f"<error_logs>{error_logs}</error_logs>\n"
+            f"<reviewer_analysis>{review_analysis}</reviewer_analysis>\n"
+            f"<rewrite_plan>{rewrite_plan}</rewrite_plan>\n\n"
+            f"<user_requirement>{user_requirement}</user_requirement>\n\n"
+            "Please update OpenFOAM files according to rewrite_plan only. "
+            "Only include files from rewrite_plan.target_files in your output."
+        )
+        if only_files:
+            rewrite_user_prompt += f" Only return these files: {', '.join(only_files)}."
+        response = global_llm_service.invoke(rewrite_user_prompt, rewrite_system_prompt, pydantic_obj=FoamPydantic)
+        return list(response.list_foamfile)
+
+    def _patch_rewrite() -> List[FoamfilePydantic]:
+        current = {(f.folder_name, f.file_name): f.content for f in foamfiles_list}
+        rewrite_user_prompt = (
+            "<foamfiles>\n" + "\n".join(_render_foamfile(f) for f in foamfiles_list) + "\n</foamfiles>\n"
+            f"<error_logs>{error_logs}</error_logs>\n"
+            f"<reviewer_analysis>{review_analysis}</reviewer_analysis>\n"
+            f"<rewrite_plan>{rewrite_plan}</rewrite_plan>\n\n"
+            f"<user_requirement>{user_requirement}</user_requirement>\n\n"
+            "Please update OpenFOAM files according to rewrite_plan only. "
+            "Only include files from rewrite_plan.target_files in your output."
+        )
+        response = global_llm_service.invoke(rewrite_user_prompt, PATCH_REWRITE_SYSTEM_PROMPT, pydantic_obj=FoamPatchPydantic)
+
+        patched = []
+        failed = []
+        for item in response.list_foamfile_patch:
+            rel_path = f"{item.folder_name}/{item.file_name}".lstrip("./")
+            original = current.get((item.folder_name, item.file_name))
+            if original is None:
+                original = read_file(os.path.join(case_dir, item.folder_name, item.file_name))
+            try:
+                content = apply_unified_diff(original, item.patch)
+            except ValueError as e:
+                logger.warning("Patch for %s did not apply (%s); falling back to full content.", rel_path, e)
+                failed.append(rel_path)
+                continue
+            patched.append(FoamfilePydantic(file_name=item.file_name, folder_name=item.folder_name, content=content))
+
+        if failed:
+            failed_set = set(failed)
+            patched.extend(
+                f for f in _full_content_rewrite(failed)
+                if f"{f.folder_name}/{f.file_name}".lstrip("./") in failed_set
+            )
+        return patched
+
+    if rewrite_protocol == "unified_diff":
+        rewritten_files = _patch_rewrite()
+    else:
+        rewritten_files = _full_content_rewrite()
 
     allowed_files = set()
     if rewrite_plan and isinstance(rewrite_plan, dict):
@@ -540,33 +726,38 @@ def rewrite_files(
                 allowed_files.add(file_path.strip().lstrip("./"))
 
     # Prepare updated structures
-    updated_dir = dict(dir_structure) if dir_structure else {}
-    foamfiles_list = []
-    if foamfiles and hasattr(foamfiles, "list_foamfile") and foamfiles.list_foamfile:
-        foamfiles_list = list(foamfiles.list_foamfile)
+    updated_dir = {folder: list(files) for folder, files in (dir_structure or {}).items()}
+    # Shadow sets for O(1) membership; updated_dir keeps ordered lists for callers
+    known_files = {folder: set(files) for folder, files in updated_dir.items()}
 
-    for foamfile in response.list_foamfile:
+    # Files the LLM echoes back unchanged are neither rewritten nor re-ordered
+    existing_contents = {(f.folder_name, f.file_name): f.content for f in foamfiles_list}
+    # (folder, file) -> foamfile; replacing a key keeps the file's position
+    foamfiles_index = {(f.folder_name, f.file_name): f for f in foamfiles_list}
+
+    pending_writes = []
+    for foamfile in rewritten_files:
         rel_path = os.path.join(foamfile.folder_name, foamfile.file_name).replace('\\', '/').lstrip('./')
         if allowed_files and rel_path not in allowed_files:
-            print(f"Warning: Skipping unplanned rewrite file: {rel_path}")
+            logger.warning("Skipping unplanned rewrite file: %s", rel_path)
+            continue
+
+        if existing_contents.get((foamfile.folder_name, foamfile.file_name)) == foamfile.content:
+            logger.debug("Skipping unchanged rewrite file: %s", rel_path)
             continue
 
         file_path = os.path.join(case_dir, foamfile.folder_name, foamfile.file_name)
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        save_file(file_path, foamfile.content)
+        pending_writes.append((file_path, foamfile.content))
 
-        if foamfile.folder_name not in updated_dir:
-            updated_dir[foamfile.folder_name] = []
-        if foamfile.file_name not in updated_dir[foamfile.folder_name]:
-            updated_dir[foamfile.folder_name].append(foamfile.file_name)
+        folder_files = known_files.setdefault(foamfile.folder_name, set())
+        if foamfile.file_name not in folder_files:
+            folder_files.add(foamfile.file_name)
+            updated_dir.setdefault(foamfile.folder_name, []).append(foamfile.file_name)
 
-        foamfiles_list = [
-            f for f in foamfiles_list
-            if not (f.folder_name == foamfile.folder_name and f.file_name == foamfile.file_name)
-        ]
-        foamfiles_list.append(foamfile)
+        foamfiles_index[(foamfile.folder_name, foamfile.file_name)] = foamfile
 
-    updated_foamfiles = FoamPydantic(list_foamfile=foamfiles_list)
+    save_files(pending_writes)
+    updated_foamfiles = FoamPydantic(list_foamfile=list(foamfiles_index.values()))
     return {
         "dir_structure": updated_dir,
         "foamfiles": updated_foamfiles,
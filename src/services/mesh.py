@@ -1,13 +1,59 @@
+import functools
 import os
 import re
 import shutil
 import subprocess
-from typing import Dict, List, Tuple, Any
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Any
 from pydantic import BaseModel, Field
-from utils import save_file
+from utils import save_file, fast_copy, ensure_foam_file, apply_boundary_patch_changes
 from . import global_llm_service
 
 
+# Bytes from the end of a mesh tool log (gmshToFoam, generate_mesh.py stderr)
+# kept in memory and forwarded to the correction prompts.
+MESH_LOG_TAIL_BYTES = 8192
+
+
+def _read_log_tail(log_path: str) -> str:
+    with open(log_path, "rb") as log:
+        log.seek(0, os.SEEK_END)
+        log.seek(max(0, log.tell() - MESH_LOG_TAIL_BYTES))
+        return log.read().decode(errors="replace")
+
+
+def _run_gmsh_to_foam(case_dir: str) -> None:
+    """Run gmshToFoam on geometry.msh, streaming its output into log.gmshToFoam.
+
+    The output goes straight to the log file instead of being buffered in
+    memory. On failure, raises CalledProcessError whose stderr holds the tail
+    of the log.
+    """
+    cmd = ["gmshToFoam", "geometry.msh"]
+    log_path = os.path.join(case_dir, "log.gmshToFoam")
+    with open(log_path, "w") as log:
+        returncode = subprocess.call(cmd, cwd=case_dir, stdout=log, stderr=subprocess.STDOUT)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=_read_log_tail(log_path))
+
+
+def _run_gmsh_python(case_dir: str, python_file: str) -> str:
+    """Run the generated Gmsh script and return the tail of its stderr.
+
+    stderr is streamed into log.generate_mesh and stdout (Gmsh progress output)
+    is discarded, so neither is buffered in memory. On failure, raises
+    CalledProcessError whose stderr holds the tail of the log.
+    """
+    cmd = ["python", python_file]
+    log_path = os.path.join(case_dir, "log.generate_mesh")
+    with open(log_path, "w") as log:
+        returncode = subprocess.call(cmd, cwd=case_dir, stdout=subprocess.DEVNULL, stderr=log)
+    stderr_tail = _read_log_tail(log_path)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr_tail)
+    return stderr_tail
+
+
 def copy_custom_mesh(custom_mesh_path: str, user_requirement: str, case_dir: str) -> Dict[str, Any]:
     """
     Copy and process a custom mesh file for OpenFOAM simulation.
@@ -52,30 +98,24 @@ def copy_custom_mesh(custom_mesh_path: str, user_requirement: str, case_dir: str
         return {"mesh_info": None, "mesh_commands": [], "error_logs": [f"Custom mesh not found: {custom_mesh_path}"]}
 
     mesh_in_case_dir = os.path.join(case_dir, "geometry.msh")
-    shutil.copy2(custom_mesh_path, mesh_in_case_dir)
+    fast_copy(custom_mesh_path, mesh_in_case_dir)
 
     constant_dir = os.path.join(case_dir, "constant")
     system_dir = os.path.join(case_dir, "system")
     os.makedirs(constant_dir, exist_ok=True)
     os.makedirs(system_dir, exist_ok=True)
 
-    controldict_prompt = (
-        f"<user_requirements>{user_requirement}</user_requirements>\n"
-        "Please create a basic controlDict file for mesh conversion. "
-        "The file should include only the essential settings needed for gmshToFoam to work. "
-        "IMPORTANT: Return ONLY the complete controlDict file content without any additional text."
-    )
+    controldict_prompt = _CONTROLDICT_USER_TMPL.format(user_requirement=user_requirement)
     # Use global llm instance
-    controldict_content = global_llm_service.invoke(controldict_prompt, (
-        "You are an expert in OpenFOAM simulation setup. "
-        "Create a minimal controlDict for gmshToFoam."
-    )).strip()
+    controldict_content = global_llm_service.invoke(
+        controldict_prompt, CONTROLDICT_SYSTEM_PROMPT
+    ).strip()
     if controldict_content:
         save_file(os.path.join(system_dir, "controlDict"), controldict_content)
 
     # Convert mesh
     try:
-        result = subprocess.run(["gmshToFoam", "geometry.msh"], cwd=case_dir, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        _run_gmsh_to_foam(case_dir)
     except subprocess.CalledProcessError as e:
         return {"mesh_info": None, "mesh_commands": [], "error_logs": [f"gmshToFoam failed: {e.stderr}"]}
 
@@ -83,9 +123,7 @@ def copy_custom_mesh(custom_mesh_path: str, user_requirement: str, case_dir: str
     if not os.path.exists(polyMesh_dir):
         return {"mesh_info": None, "mesh_commands": [], "error_logs": ["polyMesh directory not created"]}
 
-    foam_file = os.path.join(case_dir, f"{os.path.basename(case_dir)}.foam")
-    with open(foam_file, 'w') as f:
-        pass
+    ensure_foam_file(case_dir)
 
     return {
         "mesh_info": {
@@ -156,6 +194,56 @@ CONTROLDICT_SYSTEM_PROMPT = (
     "You are precise and only return the exact controlDict file content without any additional text or explanations."
 )
 
+# User prompt templates: static instructions first, per-case content last, so
+# repeated calls share a cacheable prefix.
+_CONTROLDICT_USER_TMPL = (
+    "Please create a basic controlDict file for mesh conversion. "
+    "The file should include only the essential settings needed for gmshToFoam to work. "
+    "IMPORTANT: Return ONLY the complete controlDict file content without any additional text.\n"
+    "<user_requirements>{user_requirement}</user_requirements>"
+)
+
+_BOUNDARY_EXTRACTION_USER_TMPL = (
+    "Please extract all boundary names mentioned in the user requirements. "
+    "Look for terms like inlet, outlet, wall, cylinder, top, bottom, front, back, side, etc. "
+    "Focus on boundaries that would need to be defined in the mesh for OpenFOAM simulation. "
+    "Return ONLY a comma-separated list of boundary names without any additional text.\n"
+    "<user_requirements>{user_requirement}</user_requirements>"
+)
+
+_BOUNDARY_USER_TMPL = (
+    "Please analyze the user requirements and boundary file content. "
+    "Identify which boundary is to be modified based on the boundaries mentioned in the user requirements."
+    "If this is a 2D simulation, modify ONLY the appropriate boundary to 'empty' type and 'empty' physicalType. "
+    "Based on the no slip boundaries mentioned in the user requirements, modify the appropriate boundary/boundaries to type 'wall' and physicalType 'wall'. "
+    "If this is a 3D simulation, only modify the appropriate boundary/boundaries to type 'wall' and physicalType 'wall'."
+    "IMPORTANT: Do not change any other boundaries - leave them exactly as they are. "
+    "Return ONLY the complete boundary file content with any necessary modifications. No additional text.\n"
+    "<user_requirements>{user_requirement}</user_requirements>\n"
+    "<boundary_file_content>{boundary_content}</boundary_file_content>"
+)
+
+BOUNDARY_PATCH_SYSTEM_PROMPT = (
+    "You are an expert in OpenFOAM mesh processing and simulations. "
+    "Your role is to decide which patches of an OpenFOAM polyMesh boundary file need a different type and physicalType. "
+    "You understand both 2D and 3D simulations and know how to properly set boundary conditions. "
+    "For 2D simulations, you know which boundaries should be set to 'empty' type and 'empty' physicalType. "
+    "Return strict JSON only: {\"patches\": [{\"name\": \"patchName\", \"type\": \"newType\", \"physicalType\": \"newPhysicalType\"}]}. "
+    "List only the patches that must change, using their exact names from the boundary file; "
+    "all other patches are kept exactly as they are."
+)
+
+_BOUNDARY_PATCH_USER_TMPL = (
+    "Please analyze the user requirements and boundary file content. "
+    "Identify which boundary is to be modified based on the boundaries mentioned in the user requirements. "
+    "If this is a 2D simulation, the appropriate boundary becomes type 'empty' and physicalType 'empty'. "
+    "Based on the no slip boundaries mentioned in the user requirements, the appropriate boundary/boundaries become type 'wall' and physicalType 'wall'. "
+    "If this is a 3D simulation, only the appropriate boundary/boundaries become type 'wall' and physicalType 'wall'. "
+    "Return the JSON list of patch changes only.\n"
+    "<user_requirements>{user_requirement}</user_requirements>\n"
+    "<boundary_file_content>{boundary_content}</boundary_file_content>"
+)
+
 GMSH_PYTHON_SYSTEM_PROMPT = (
     "You are an expert in GMSH Python API and OpenFOAM mesh generation. "
     "Your role is to create Python code that uses the GMSH library to generate meshes based on user requirements. "
@@ -257,6 +345,61 @@ GMSH_PYTHON_ERROR_CORRECTION_SYSTEM_PROMPT = (
 )
 
 
+class BoundaryPatchChange(BaseModel):
+    name: str = Field(description="Exact patch name from the boundary file")
+    type: str = Field(description="New patch type, e.g. wall or empty")
+    physicalType: Optional[str] = Field(default=None, description="New physicalType, usually the same as type")
+
+
+class BoundaryPatchPlan(BaseModel):
+    patches: List[BoundaryPatchChange] = Field(default_factory=list, description="Patches whose type must change")
+
+
+@functools.lru_cache(maxsize=32)
+def _plan_boundary_changes(boundary_content: str, user_requirement: str) -> BoundaryPatchPlan:
+    """Boundary patch plan for one gmshToFoam output.
+
+    gmshToFoam regenerates an identical boundary file whenever a retry keeps the
+    geometry, so the plan is memoized per (content, requirement) and, with the
+    LLM response cache enabled, reused across runs.
+    """
+    return global_llm_service.invoke(
+        _BOUNDARY_PATCH_USER_TMPL.format(user_requirement=user_requirement, boundary_content=boundary_content),
+        BOUNDARY_PATCH_SYSTEM_PROMPT,
+        pydantic_obj=BoundaryPatchPlan,
+        use_cache=True,
+    )
+
+
+def update_boundary_types(boundary_file: str, user_requirement: str, boundary_content: Optional[str] = None) -> None:
+    """Set patch types in a polyMesh boundary file according to the user requirement.
+
+    The LLM returns only the patches to change, which are applied in place with
+    apply_boundary_patch_changes. If that fails (invalid response or an unknown
+    patch name), the LLM rewrites the full boundary file instead. Pass
+    boundary_content when the caller has already read the file.
+    """
+    if boundary_content is None:
+        with open(boundary_file, 'r') as f:
+            boundary_content = f.read()
+    try:
+        plan = _plan_boundary_changes(boundary_content, user_requirement)
+        changes = {
+            p.name: {"type": p.type, "physicalType": p.physicalType or p.type}
+            for p in plan.patches
+        }
+        updated_boundary_content = apply_boundary_patch_changes(boundary_content, changes)
+    except Exception:
+        boundary_prompt = _BOUNDARY_USER_TMPL.format(
+            user_requirement=user_requirement, boundary_content=boundary_content
+        )
+        updated_boundary_content = global_llm_service.invoke(
+            boundary_prompt, BOUNDARY_SYSTEM_PROMPT
+        ).strip()
+    if updated_boundary_content and updated_boundary_content != boundary_content:
+        save_file(boundary_file, updated_boundary_content)
+
+
 class GMSHPythonCode(BaseModel):
     python_code: str = Field(description="Complete Python code using GMSH library")
     mesh_type: str = Field(description="Type of mesh (2D or 3D)")
@@ -270,14 +413,11 @@ class GMSHPythonCorrection(BaseModel):
 
 def extract_boundary_names_from_requirements(user_requirement: str) -> List[str]:
     try:
-        extraction_prompt = (
-            f"<user_requirements>{user_requirement}</user_requirements>\n"
-            "Please extract all boundary names mentioned in the user requirements. "
-            "Look for terms like inlet, outlet, wall, cylinder, top, bottom, front, back, side, etc. "
-            "Focus on boundaries that would need to be defined in the mesh for OpenFOAM simulation. "
-            "Return ONLY a comma-separated list of boundary names without any additional text."
-        )
-        boundary_response = global_llm_service.invoke(extraction_prompt, BOUNDARY_EXTRACTION_SYSTEM_PROMPT).strip()
+        extraction_prompt = _BOUNDARY_EXTRACTION_USER_TMPL.format(user_requirement=user_requirement)
+        boundary_response = global_llm_service.invoke(
+            extraction_prompt,
+            BOUNDARY_EXTRACTION_SYSTEM_PROMPT,
+        ).strip()
         if boundary_response:
             return [name.strip() for name in boundary_response.split(',') if name.strip()]
         return []
@@ -288,12 +428,11 @@ def extract_boundary_names_from_requirements(user_requirement: str) -> List[str]
         return [k for k in boundary_keywords if k in requirement_lower]
 
 
-def check_boundary_file_for_missing_boundaries(boundary_file_path: str, expected_boundaries: List[str]):
-    if not os.path.exists(boundary_file_path):
-        return False, expected_boundaries, []
+def check_boundary_file_for_missing_boundaries(boundary_file_path: str, expected_boundaries: List[str], content: Optional[str] = None):
     try:
-        with open(boundary_file_path, 'r') as f:
-            content = f.read()
+        if content is None:
+            with open(boundary_file_path, 'r') as f:
+                content = f.read()
         boundary_pattern = r'(\w+)\s*\{'
         found_boundaries = re.findall(boundary_pattern, content)
         boundary_keywords = ['type', 'physicalType', 'nFaces', 'startFace', 'FoamFile']
@@ -429,15 +568,27 @@ def handle_gmsh_mesh(
     """
     case_dir = os.path.abspath(case_dir)
     error_logs: List[str] = []
-    if os.path.exists(case_dir):
+    try:
         shutil.rmtree(case_dir)
-    os.makedirs(case_dir)
+    except FileNotFoundError:
+        pass
 
     python_file = os.path.join(case_dir, "generate_mesh.py")
     msh_file = os.path.join(case_dir, "geometry.msh")
 
     expected_boundaries = extract_boundary_names_from_requirements(user_requirement)
 
+    # Loop-invariant conversion setup: the directories and the controlDict do not
+    # depend on the generated geometry, so they are prepared once and the
+    # controlDict is requested at most once (on the first attempt that reaches gmshToFoam).
+    # mkdir(parents=True) also recreates case_dir itself.
+    constant_dir = os.path.join(case_dir, "constant")
+    system_dir = os.path.join(case_dir, "system")
+    polyMesh_dir = os.path.join(constant_dir, "polyMesh")
+    Path(constant_dir).mkdir(parents=True)
+    Path(system_dir).mkdir()
+    controldict_ready = False
+
     gmsh_python_current_loop = 0
     corrected_python_code = None
 
@@ -468,15 +619,7 @@ def handle_gmsh_mesh(
             save_file(python_file, python_code_to_use)
             corrected_python_code = None
 
-            process = subprocess.Popen(["python", python_file], cwd=case_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, universal_newlines=True)
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-            return_code = process.wait()
-            stderr_output = process.stderr.read()
-            if return_code != 0:
-                raise subprocess.CalledProcessError(return_code, process.args, stderr=stderr_output)
+            stderr_output = _run_gmsh_python(case_dir, python_file)
 
             if not os.path.exists(msh_file):
                 if stderr_output and gmsh_python_current_loop < max_loop:
@@ -489,28 +632,29 @@ def handle_gmsh_mesh(
                 continue
 
             # Preprocess for OpenFOAM conversion
-            constant_dir = os.path.join(case_dir, "constant")
-            system_dir = os.path.join(case_dir, "system")
-            os.makedirs(constant_dir, exist_ok=True)
-            os.makedirs(system_dir, exist_ok=True)
-            controldict_prompt = (
-                f"<user_requirements>{user_requirement}</user_requirements>\n"
-                "Please create a basic controlDict file for mesh conversion. "
-                "The file should include only the essential settings needed for gmshToFoam to work. "
-                "IMPORTANT: Return ONLY the complete controlDict file content without any additional text."
-            )
-            controldict_content = global_llm_service.invoke(controldict_prompt, CONTROLDICT_SYSTEM_PROMPT).strip()  # type: ignore
-            if controldict_content:
-                save_file(os.path.join(system_dir, "controlDict"), controldict_content)
-
-            result = subprocess.run(["gmshToFoam", "geometry.msh"], cwd=case_dir, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            polyMesh_dir = os.path.join(constant_dir, "polyMesh")
+            if not controldict_ready:
+                controldict_prompt = _CONTROLDICT_USER_TMPL.format(user_requirement=user_requirement)
+                controldict_content = global_llm_service.invoke(
+                    controldict_prompt, CONTROLDICT_SYSTEM_PROMPT
+                ).strip()  # type: ignore
+                if controldict_content:
+                    save_file(os.path.join(system_dir, "controlDict"), controldict_content)
+                controldict_ready = True
+
+            _run_gmsh_to_foam(case_dir)
             if not os.path.exists(polyMesh_dir):
                 raise subprocess.CalledProcessError(1, "gmshToFoam", "polyMesh directory not created")
 
             boundary_file = os.path.join(polyMesh_dir, "boundary")
-            if os.path.exists(boundary_file):
-                all_present, missing_boundaries, found_boundaries = check_boundary_file_for_missing_boundaries(boundary_file, expected_boundaries)
+            try:
+                with open(boundary_file, 'r') as f:
+                    boundary_content = f.read()
+            except FileNotFoundError:
+                boundary_content = None
+            if boundary_content is not None:
+                all_present, missing_boundaries, found_boundaries = check_boundary_file_for_missing_boundaries(
+                    boundary_file, expected_boundaries, boundary_content
+                )
                 if set(found_boundaries) != set(expected_boundaries):
                     if gmsh_python_current_loop < max_loop:
                         with open(python_file, 'r') as f:
@@ -536,27 +680,10 @@ def handle_gmsh_mesh(
                     return {"mesh_info": None, "mesh_commands": [], "mesh_file_destination": None, "error_logs": error_logs}
 
                 # Boundary update as per requirements
-                with open(boundary_file, 'r') as f:
-                    boundary_content = f.read()
-                boundary_prompt = (
-                    f"<user_requirements>{user_requirement}</user_requirements>\n"
-                    f"<boundary_file_content>{boundary_content}</boundary_file_content>\n"
-                    "Please analyze the user requirements and boundary file content. "
-                    "Identify which boundary is to be modified based on the boundaries mentioned in the user requirements."
-                    "If this is a 2D simulation, modify ONLY the appropriate boundary to 'empty' type and 'empty' physicalType. "
-                    "Based on the no slip boundaries mentioned in the user requirements, modify the appropriate boundary/boundaries to type 'wall' and physicalType 'wall'. "
-                    "If this is a 3D simulation, only modify the appropriate boundary/boundaries to type 'wall' and physicalType 'wall'."
-                    "IMPORTANT: Do not change any other boundaries - leave them exactly as they are. "
-                    "Return ONLY the complete boundary file content with any necessary modifications. No additional text."
-                )
-                updated_boundary_content = global_llm_service.invoke(boundary_prompt, BOUNDARY_SYSTEM_PROMPT).strip()  # type: ignore
-                if updated_boundary_content:
-                    save_file(boundary_file, updated_boundary_content)
+                update_boundary_types(boundary_file, user_requirement, boundary_content)
 
             # Create .foam file and return info
-            foam_file = os.path.join(case_dir, f"{os.path.basename(case_dir)}.foam")
-            with open(foam_file, 'w'):
-                pass
+            ensure_foam_file(case_dir)
 
             mesh_commands: List[str] = []
             return {
@@ -1,5 +1,11 @@
+import copy
+import hashlib
+import json
 import os
 import re
+import threading
+import time
+from collections import OrderedDict
 from typing import Dict, Any, List, Tuple, Optional
 from pathlib import Path
 from pydantic import BaseModel, Field
@@ -7,6 +13,25 @@ from utils import LLMService, retrieve_faiss, parse_directory_structure
 from . import global_llm_service
 
 
+# Plans already generated in this process, keyed by the inputs of
+# generate_simulation_plan, so re-planning an identical request skips its
+# LLM calls and retrieval. Only used with use_cache (Config.llm_response_cache);
+# entries expire after _PLAN_CACHE_TTL_S seconds.
+_PLAN_CACHE_MAXSIZE = 256
+_PLAN_CACHE_TTL_S = 3600
+_plan_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+
+def _plan_cache_key(user_requirement: str, case_stats: Dict[str, List[str]], case_dir: str, searchdocs: int) -> str:
+    payload = json.dumps(
+        {"u": user_requirement, "s": case_stats, "d": case_dir, "sd": searchdocs},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
 class CaseSummaryModel(BaseModel):
     case_name: str = Field(description="name of the case")
     case_domain: str = Field(description="domain of the case")
@@ -262,7 +287,8 @@ def generate_simulation_plan(
     user_requirement: str,
     case_stats: Dict[str, List[str]],
     case_dir: str = "",
-    searchdocs: int = 2
+    searchdocs: int = 2,
+    use_cache: bool = False,
 ) -> Dict[str, Any]:
     """
     Generate a complete simulation plan by parsing requirements and creating subtasks.
@@ -278,6 +304,7 @@ def generate_simulation_plan(
         case_stats (Dict[str, List[str]]): Available case statistics
         case_dir (str, optional): Custom case directory path
         searchdocs (int, optional): Number of similar documents to retrieve
+        use_cache (bool, optional): Reuse a plan memoized in this process for identical inputs
     
     Returns:
         Dict[str, Any]: Complete plan containing:
@@ -292,7 +319,19 @@ def generate_simulation_plan(
     Raises:
         ValueError: If subtasks cannot be generated
         RuntimeError: If any step in the planning process fails
+
+    With use_cache, plans are memoized in-process on (user_requirement,
+    case_stats, case_dir, searchdocs) for up to an hour; a cache hit returns a
+    copy of the stored plan. Without it every call plans afresh.
     """
+    cache_key = _plan_cache_key(user_requirement, case_stats, case_dir, searchdocs)
+    if use_cache:
+        with _plan_cache_lock:
+            entry = _plan_cache.get(cache_key)
+            if entry is not None and time.monotonic() - entry[0] <= _PLAN_CACHE_TTL_S:
+                _plan_cache.move_to_end(cache_key)
+                return copy.deepcopy(entry[1])
+
     # Step 1: Parse user requirement to case info
     case_info = parse_requirement_to_case_info(user_requirement, case_stats)
     case_name = case_info["case_name"]
@@ -327,7 +366,7 @@ def generate_simulation_plan(
     # Prepare reference file path
     case_path_reference = os.path.join(resolved_case_dir, "similar_case.txt")
     
-    return {
+    plan = {
         "case_name": case_name,
         "case_domain": case_domain,
         "case_category": case_category,
@@ -340,5 +379,12 @@ def generate_simulation_plan(
         "subtasks": subtasks,
         "similar_case_advice": advice,
     }
+    if use_cache:
+        with _plan_cache_lock:
+            _plan_cache[cache_key] = (time.monotonic(), copy.deepcopy(plan))
+            _plan_cache.move_to_end(cache_key)
+            while len(_plan_cache) > _PLAN_CACHE_MAXSIZE:
+                _plan_cache.popitem(last=False)
+    return plan
 
 
@@ -1,7 +1,13 @@
-from typing import List, Optional, Tuple, Any
+import hashlib
+import logging
+import re
+from typing import List, Literal, Optional, Tuple, Any
 from pydantic import BaseModel, Field
+from utils import FoamPydantic, serialize_foamfiles
 from . import global_llm_service
 
+logger = logging.getLogger(__name__)
+
 
 class PlannedFileChange(BaseModel):
     file: str = Field(description="Relative file path, e.g. system/fvSchemes or 0/U")
@@ -24,15 +30,106 @@ REVIEWER_SYSTEM_PROMPT = (
 )
 
 
-def review_error_logs(
+class ReviewWithPlan(BaseModel):
+    review_analysis: str = Field(description="Diagnosis of the errors and proposed fixes")
+    action: Literal["rewrite", "skip", "halt"] = Field(
+        default="rewrite",
+        description="rewrite: apply target_files; skip: rerun without changes; halt: stop, the errors cannot be fixed by editing files",
+    )
+    rerun_reason: str = Field(
+        default="",
+        description="Only for skip: the transient cause that makes an unchanged rerun likely to succeed",
+    )
+    target_files: List[PlannedFileChange] = Field(default_factory=list, description="Files to modify and required changes")
+
+
+REVIEW_AND_PLAN_SYSTEM_PROMPT = (
+    REVIEWER_SYSTEM_PROMPT + " "
+    "After the review, also create a minimal rewrite plan for the files that must change. "
+    "Output MUST be strict JSON only, with this exact schema: "
+    "{\"review_analysis\": \"your diagnosis and suggestions\", \"action\": \"rewrite\", \"rerun_reason\": \"\", "
+    "\"target_files\": [{\"file\": \"relative/path\", \"changes\": \"change1; change2\"}]}. "
+    "Set action to \"rewrite\" when files must change (the usual case), \"skip\" only when the error is transient "
+    "and the unchanged case should simply be rerun, or \"halt\" when no file edit can fix the error "
+    "(e.g. a missing OpenFOAM installation or executable); target_files is empty unless action is \"rewrite\". "
+    "With \"skip\", rerun_reason must name the transient cause (e.g. a timeout or a killed process) that makes "
+    "an identical rerun likely to succeed; without one, use \"rewrite\". "
+    "Rules for target_files: "
+    "1) Use double quotes for all strings. "
+    "2) In changes, use short plain text actions separated by semicolons. "
+    "3) Do not include parentheses, backticks, or quote characters inside changes text. "
+    "4) Do not include run steps; only file edits."
+)
+
+
+# Above this many characters of file content, only the files named in the
+# error logs and the files that usually cause errors without being named
+# (system/*, constant/polyMesh/boundary) are sent in full; every other file
+# is cut to its first REVIEW_TRUNCATED_FILE_CHARS characters.
+REVIEW_FULL_CONTEXT_CHARS = 60000
+REVIEW_TRUNCATED_FILE_CHARS = 2000
+
+
+def _always_in_full(foamfile: Any) -> bool:
+    folder = foamfile.folder_name.replace("\\", "/").rstrip("/")
+    if folder == "system" or folder.endswith("/system"):
+        return True
+    return foamfile.file_name == "boundary" and folder.endswith("polyMesh")
+
+
+def _foamfiles_for_review(foamfiles: Any, error_logs: Any) -> str:
+    """Serialize foamfiles for a review prompt, trimming large cases to the error-relevant files."""
+    files = getattr(foamfiles, "list_foamfile", None)
+    if not files or sum(len(f.content) for f in files) <= REVIEW_FULL_CONTEXT_CHARS:
+        return serialize_foamfiles(foamfiles)
+
+    log_text = str(error_logs)
+    trimmed, truncated = [], 0
+    for f in files:
+        # Also matches qualified forms such as fvSchemes.divSchemes or system/fvSchemes.
+        mentioned = re.search(rf"(?<!\w){re.escape(f.file_name)}(?!\w)", log_text)
+        if mentioned or _always_in_full(f) or len(f.content) <= REVIEW_TRUNCATED_FILE_CHARS:
+            trimmed.append(f)
+            continue
+        truncated += 1
+        cut = len(f.content) - REVIEW_TRUNCATED_FILE_CHARS
+        trimmed.append(f.model_copy(update={
+            "content": f.content[:REVIEW_TRUNCATED_FILE_CHARS]
+            + f"\n... [truncated {cut} more characters; file not named in the error logs]",
+        }))
+
+    logger.debug("Review context: truncated %d of %d file(s) not named in the error logs", truncated, len(files))
+    return serialize_foamfiles(FoamPydantic(list_foamfile=trimmed))
+
+
+# Reviewer user prompts: first attempt, and follow-up attempts with history.
+_REVIEWER_TMPL_FIRST = (
+    "<similar_case_reference>{tutorial_reference}</similar_case_reference>\n"
+    "{advice_text}"
+    "<foamfiles>{foamfiles}</foamfiles>\n"
+    "<error_logs>{error_logs}</error_logs>\n"
+    "<user_requirement>{user_requirement}</user_requirement>\n"
+    "Please review the error logs and provide guidance on how to resolve the reported errors. Make sure your suggestions adhere to user requirements and do not contradict it."
+)
+_REVIEWER_TMPL_WITH_HISTORY = (
+    "<similar_case_reference>{tutorial_reference}</similar_case_reference>\n"
+    "{advice_text}"
+    "<foamfiles>{foamfiles}</foamfiles>\n"
+    "<current_error_logs>{error_logs}</current_error_logs>\n"
+    "<history>\n{history}\n</history>\n\n"
+    "<user_requirement>{user_requirement}</user_requirement>\n\n"
+    "I have modified the files according to your previous suggestions. If the error persists, please provide further guidance. Make sure your suggestions adhere to user requirements and do not contradict it. Also, please consider the previous attempts and try a different approach."
+)
+
+
+def _build_reviewer_user_prompt(
     tutorial_reference: str,
     foamfiles: Any,
     error_logs: List[str],
     user_requirement: str,
-    similar_case_advice: Optional[Any] = None,
-    history_text: Optional[List[str]] = None,
-) -> Tuple[str, List[str]]:
-    """Stateless reviewer: returns (review_analysis, updated_history)."""
+    similar_case_advice: Optional[Any],
+    history_text: Optional[List[str]],
+) -> str:
     advice_text = ""
     if isinstance(similar_case_advice, dict):
         advice_text = (
@@ -45,38 +142,125 @@ def review_error_logs(
     elif similar_case_advice:
         advice_text = f"<similar_case_advice>{similar_case_advice}</similar_case_advice>\n"
 
+    foamfiles_text = _foamfiles_for_review(foamfiles, error_logs)
     if history_text:
-        reviewer_user_prompt = (
-            f"<similar_case_reference>{tutorial_reference}</similar_case_reference>\n"
-            f"{advice_text}"
-            f"<foamfiles>{str(foamfiles)}</foamfiles>\n"
-            f"<current_error_logs>{error_logs}</current_error_logs>\n"
-            f"<history>\n{chr(10).join(history_text)}\n</history>\n\n"
-            f"<user_requirement>{user_requirement}</user_requirement>\n\n"
-            f"I have modified the files according to your previous suggestions. If the error persists, please provide further guidance. Make sure your suggestions adhere to user requirements and do not contradict it. Also, please consider the previous attempts and try a different approach."
-        )
-    else:
-        reviewer_user_prompt = (
-            f"<similar_case_reference>{tutorial_reference}</similar_case_reference>\n"
-            f"{advice_text}"
-            f"<foamfiles>{str(foamfiles)}</foamfiles>\n"
-            f"<error_logs>{error_logs}</error_logs>\n"
-            f"<user_requirement>{user_requirement}</user_requirement>\n"
-            "Please review the error logs and provide guidance on how to resolve the reported errors. Make sure your suggestions adhere to user requirements and do not contradict it."
+        return _REVIEWER_TMPL_WITH_HISTORY.format(
+            tutorial_reference=tutorial_reference,
+            advice_text=advice_text,
+            foamfiles=foamfiles_text,
+            error_logs=error_logs,
+            history="\n".join(history_text),
+            user_requirement=user_requirement,
         )
+    return _REVIEWER_TMPL_FIRST.format(
+        tutorial_reference=tutorial_reference,
+        advice_text=advice_text,
+        foamfiles=foamfiles_text,
+        error_logs=error_logs,
+        user_requirement=user_requirement,
+    )
 
-    review_response = global_llm_service.invoke(reviewer_user_prompt, REVIEWER_SYSTEM_PROMPT)
-    review_content = review_response
 
+def _append_attempt(history_text: Optional[List[str]], error_logs: List[str], review_content: str) -> List[str]:
+    """Append one 4-entry attempt record to the history.
+
+    Error logs identical to an earlier attempt's are stored as a back-reference
+    instead of being repeated, so the history prompt does not grow with copies
+    of the same logs.
+    """
     updated_history = list(history_text) if history_text else []
+    error_text = str(error_logs)
+    digest = hashlib.sha256(error_text.encode()).hexdigest()[:12]
+    marker = f'<Error_Logs digest="{digest}">'
+    # Each attempt is 4 entries; its Error_Logs entry is the second one
+    same_as = next(
+        (i // 4 + 1 for i in range(1, len(updated_history), 4) if updated_history[i].startswith(marker)),
+        None,
+    )
+    error_body = error_text if same_as is None else f"(same as attempt {same_as})"
     current_attempt = [
         f"<Attempt {len(updated_history)//4 + 1}>\n",
-        f"<Error_Logs>\n{error_logs}\n</Error_Logs>",
+        f"{marker}\n{error_body}\n</Error_Logs>",
         f"<Review_Analysis>\n{review_content}\n</Review_Analysis>",
         f"</Attempt>\n",
     ]
     updated_history.extend(current_attempt)
-    return review_content, updated_history
+    return updated_history
+
+
+def review_error_logs(
+    tutorial_reference: str,
+    foamfiles: Any,
+    error_logs: List[str],
+    user_requirement: str,
+    similar_case_advice: Optional[Any] = None,
+    history_text: Optional[List[str]] = None,
+) -> Tuple[str, List[str]]:
+    """Stateless reviewer: returns (review_analysis, updated_history)."""
+    reviewer_user_prompt = _build_reviewer_user_prompt(
+        tutorial_reference, foamfiles, error_logs, user_requirement, similar_case_advice, history_text
+    )
+
+    review_response = global_llm_service.invoke(reviewer_user_prompt, REVIEWER_SYSTEM_PROMPT, use_cache=True)
+    review_content = review_response
+
+    return review_content, _append_attempt(history_text, error_logs, review_content)
+
+
+def review_and_plan(
+    tutorial_reference: str,
+    foamfiles: Any,
+    error_logs: List[str],
+    user_requirement: str,
+    similar_case_advice: Optional[Any] = None,
+    history_text: Optional[List[str]] = None,
+) -> Tuple[str, List[str], dict, str]:
+    """Review and rewrite planning in one LLM call.
+
+    Returns (review_analysis, updated_history, rewrite_plan, action), equivalent
+    to review_error_logs followed by generate_rewrite_plan but sending the
+    shared foamfiles/error-log context only once. action is "rewrite", "skip"
+    (rerun unchanged) or "halt" (stop the loop). A "skip" without a rerun_reason
+    is returned as "rewrite": rerunning an unchanged case would fail the same way.
+    """
+    reviewer_user_prompt = _build_reviewer_user_prompt(
+        tutorial_reference, foamfiles, error_logs, user_requirement, similar_case_advice, history_text
+    )
+
+    response = global_llm_service.invoke(
+        reviewer_user_prompt,
+        REVIEW_AND_PLAN_SYSTEM_PROMPT,
+        pydantic_obj=ReviewWithPlan,
+        use_cache=True,
+    )
+    review_content = response.review_analysis
+    rewrite_plan = RewritePlan(target_files=response.target_files).model_dump()
+    action = response.action
+    if action == "skip" and not response.rerun_reason.strip():
+        action = "rewrite"
+
+    return review_content, _append_attempt(history_text, error_logs, review_content), rewrite_plan, action
+
+
+PLANNER_SYSTEM_PROMPT = (
+    "You are an OpenFOAM debugging planner. "
+    "Given current foam files, error logs and reviewer analysis, create a minimal rewrite plan. "
+    "Output MUST be strict JSON only, with this exact schema: "
+    "{\"target_files\": [{\"file\": \"relative/path\", \"changes\": \"change1; change2\"}]}. "
+    "Rules: "
+    "1) Do not use markdown, backticks, or comments. "
+    "2) Use double quotes for all strings. "
+    "3) In changes, use short plain text actions separated by semicolons. "
+    "4) Do not include parentheses, backticks, or quote characters inside changes text. "
+    "5) Do not include run steps; only file edits."
+)
+_PLANNER_USER_TMPL = (
+    "<foamfiles>{foamfiles}</foamfiles>\n"
+    "<error_logs>{error_logs}</error_logs>\n"
+    "<review_analysis>{review_analysis}</review_analysis>\n"
+    "<user_requirement>{user_requirement}</user_requirement>\n"
+    "Return strict JSON now with key target_files only."
+)
 
 
 def generate_rewrite_plan(
@@ -86,31 +270,18 @@ def generate_rewrite_plan(
     user_requirement: str,
 ) -> dict:
     """Generate a minimal, explicit rewrite plan for downstream rewrite step."""
-    planner_system_prompt = (
-        "You are an OpenFOAM debugging planner. "
-        "Given current foam files, error logs and reviewer analysis, create a minimal rewrite plan. "
-        "Output MUST be strict JSON only, with this exact schema: "
-        "{\"target_files\": [{\"file\": \"relative/path\", \"changes\": \"change1; change2\"}]}. "
-        "Rules: "
-        "1) Do not use markdown, backticks, or comments. "
-        "2) Use double quotes for all strings. "
-        "3) In changes, use short plain text actions separated by semicolons. "
-        "4) Do not include parentheses, backticks, or quote characters inside changes text. "
-        "5) Do not include run steps; only file edits."
-    )
-
-    planner_user_prompt = (
-        f"<foamfiles>{str(foamfiles)}</foamfiles>\n"
-        f"<error_logs>{error_logs}</error_logs>\n"
-        f"<review_analysis>{review_analysis}</review_analysis>\n"
-        f"<user_requirement>{user_requirement}</user_requirement>\n"
-        "Return strict JSON now with key target_files only."
+    planner_user_prompt = _PLANNER_USER_TMPL.format(
+        foamfiles=_foamfiles_for_review(foamfiles, error_logs),
+        error_logs=error_logs,
+        review_analysis=review_analysis,
+        user_requirement=user_requirement,
     )
 
     response = global_llm_service.invoke(
         planner_user_prompt,
-        planner_system_prompt,
+        PLANNER_SYSTEM_PROMPT,
         pydantic_obj=RewritePlan,
+        use_cache=True,
     )
     return response.model_dump()
 
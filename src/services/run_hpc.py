@@ -1,12 +1,120 @@
-from typing import Optional, Tuple, Dict
+from typing import Optional, Tuple, Dict, Union
 import os
 import json
 import subprocess
 import re
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
 from models import HPCScriptIn, HPCScriptOut, RunIn, RunOut, JobStatusIn, JobStatusOut
-from utils import check_foam_errors, save_file
+from utils import check_foam_errors, save_file_atomic
 from . import global_llm_service
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Leading ```bash / ```json / ``` and trailing ``` around an LLM answer.
+_FENCE_RE = re.compile(r'^\s*```(?:bash|sh|json)?[ \t]*\n?|\n?```\s*$')
+
+
+def _strip_code_fence(text: str) -> str:
+    """Remove a surrounding markdown code fence from an LLM response."""
+    return _FENCE_RE.sub('', text).strip()
+
+
+def _loads_json(text: str):
+    """Parse JSON with orjson when installed, falling back to the stdlib."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+# SLURM time formats: [D-]HH:MM[:SS], or a number of hours with an optional unit.
+_SLURM_TIME_RE = re.compile(r'^(?:(\d+)-)?(\d+):(\d{1,2})(?::(\d{1,2}))?$')
+_HOURS_RE = re.compile(r'^(\d+(?:\.\d+)?)\s*(?:h|hrs?|hours?)?$', re.IGNORECASE)
+_MEMORY_RE = re.compile(r'^(\d+(?:\.\d+)?)\s*(?:([mgt])(?:i?b)?)?$', re.IGNORECASE)
+_GB_PER_UNIT = {"m": 1 / 1024, "g": 1, "t": 1024}
+
+
+def _whole(value: float):
+    """Return ``value`` as an int when it has no fractional part."""
+    return int(value) if float(value).is_integer() else value
+
+
+def _parse_hours(value):
+    """Hours from a number or a SLURM time string; unparseable strings are kept as given."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _whole(value)
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    match = _SLURM_TIME_RE.match(text)
+    if match:
+        days, hours, minutes, seconds = (int(g or 0) for g in match.groups())
+        return _whole(round(days * 24 + hours + minutes / 60 + seconds / 3600, 4))
+    match = _HOURS_RE.match(text)
+    if match:
+        return _whole(float(match.group(1)))
+    return text
+
+
+def _parse_gb(value):
+    """Gigabytes from a number or a size such as ``128GB``; unparseable strings are kept as given."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _whole(value)
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    match = _MEMORY_RE.match(text)
+    if match:
+        unit = (match.group(2) or "g").lower()
+        return _whole(round(float(match.group(1)) * _GB_PER_UNIT[unit], 4))
+    return text
+
+
+class ClusterInfo(BaseModel):
+    """Cluster settings used to build SLURM scripts, with the defaults applied
+    when the LLM omits a value or returns one of the wrong type. time_limit
+    (hours) and memory (GB per node) accept SLURM-style strings such as
+    ``48:00:00`` or ``128GB``; a string that can't be parsed is passed through."""
+    model_config = ConfigDict(extra="allow")
+
+    cluster_name: str = "default_cluster"
+    account_number: str = "default_account"
+    partition: str = "normal"
+    nodes: int = 1
+    ntasks_per_node: int = 1
+    time_limit: Union[int, float, str] = 24
+    memory: Union[int, float, str] = 64
+
+    @field_validator("cluster_name", "account_number", "partition", mode="before")
+    @classmethod
+    def _numbers_to_str(cls, value):
+        # LLMs often return account numbers as bare integers.
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        return value
+
+    @field_validator("time_limit", mode="before")
+    @classmethod
+    def _time_to_hours(cls, value):
+        return _parse_hours(value)
+
+    @field_validator("memory", mode="before")
+    @classmethod
+    def _memory_to_gb(cls, value):
+        return _parse_gb(value)
+
+    @classmethod
+    def from_llm(cls, data: dict) -> "ClusterInfo":
+        """Validate ``data``, replacing invalid or null fields by their defaults."""
+        try:
+            return cls(**data)
+        except ValidationError as e:
+            invalid = {err["loc"][0] for err in e.errors() if err["loc"]}
+            return cls(**{k: v for k, v in data.items() if k not in invalid})
+
 
 def create_slurm_script(case_dir: str, cluster_info: dict) -> str:
     """
@@ -52,21 +160,14 @@ def create_slurm_script(case_dir: str, cluster_info: dict) -> str:
     response = global_llm_service.invoke(user_prompt, system_prompt)
     
     # Clean up the response to extract just the script content
-    script_content = response.strip()
-    if script_content.startswith('```bash'):
-        script_content = script_content[7:]
-    elif script_content.startswith('```'):
-        script_content = script_content[3:]
-    if script_content.endswith('```'):
-        script_content = script_content[:-3]
-    script_content = script_content.strip()
+    script_content = _strip_code_fence(response)
     
     # Ensure the script starts with shebang
     if not script_content.startswith('#!/bin/bash'):
         script_content = '#!/bin/bash\n' + script_content
     
     script_path = os.path.join(case_dir, "submit_job.slurm")
-    save_file(script_path, script_content)
+    save_file_atomic(script_path, script_content)
     return script_path
 
 
@@ -134,21 +235,14 @@ def create_slurm_script_with_error_context(case_dir: str, cluster_info: dict, er
     response = global_llm_service.invoke(user_prompt, system_prompt)
     
     # Clean up the response to extract just the script content
-    script_content = response.strip()
-    if script_content.startswith('```bash'):
-        script_content = script_content[7:]
-    elif script_content.startswith('```'):
-        script_content = script_content[3:]
-    if script_content.endswith('```'):
-        script_content = script_content[:-3]
-    script_content = script_content.strip()
+    script_content = _strip_code_fence(response)
     
     # Ensure the script starts with shebang
     if not script_content.startswith('#!/bin/bash'):
         script_content = '#!/bin/bash\n' + script_content
     
     script_path = os.path.join(case_dir, "submit_job.slurm")
-    save_file(script_path, script_content)
+    save_file_atomic(script_path, script_content)
     return script_path
 
 
@@ -262,57 +356,21 @@ def extract_cluster_info_from_requirement(user_requirement: str, case_dir: str)
     # Try to parse the JSON response
     try:
         # Clean up the response to extract JSON
-        response = response.strip()
-        if response.startswith('```json'):
-            response = response[7:]
-        if response.endswith('```'):
-            response = response[:-3]
-        response = response.strip()
-        
-        cluster_info = json.loads(response)
+        response = _strip_code_fence(response)
         
-        # Set defaults for missing values
-        defaults = {
-            'cluster_name': 'default_cluster',
-            'account_number': 'default_account',
-            'partition': 'normal',
-            'nodes': 1,
-            'ntasks_per_node': 1,
-            'time_limit': 24,
-            'memory': 64
-        }
+        cluster_info = _loads_json(response)
         
-        for key, default_value in defaults.items():
-            if key not in cluster_info or cluster_info[key] is None:
-                cluster_info[key] = default_value
-                
-        return cluster_info
+        return ClusterInfo.from_llm(cluster_info).model_dump()
         
     except (json.JSONDecodeError, KeyError) as e:
         print(f"Error parsing cluster info from LLM response: {e}")
         print(f"LLM response: {response}")
         # Return default values if parsing fails
-        return {
-            'cluster_name': 'default_cluster',
-            'account_number': 'default_account',
-            'partition': 'normal',
-            'nodes': 1,
-            'ntasks_per_node': 1,
-            'time_limit': 24,
-            'memory': 64
-        }
+        return ClusterInfo().model_dump()
     except Exception as e:
         print(f"Unexpected error in extract_cluster_info_from_requirement: {e}")
         # Return default values for unexpected errors
-        return {
-            'cluster_name': 'default_cluster',
-            'account_number': 'default_account',
-            'partition': 'normal',
-            'nodes': 1,
-            'ntasks_per_node': 1,
-            'time_limit': 24,
-            'memory': 64
-        }
+        return ClusterInfo().model_dump()
 
 
 def check_logs_for_errors(case_dir: str):
@@ -1,9 +1,30 @@
+import logging
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Any
 from models import RunIn, RunOut
 from utils import remove_files, remove_file, remove_numeric_folders, run_command, check_foam_errors
 
+logger = logging.getLogger(__name__)
+
+
+def _cleanup_case(case_dir: str, out_file: str, err_file: str) -> None:
+    """Remove logs, Allrun output and time folders from a previous run.
+
+    The removals touch disjoint paths, so they run concurrently.
+    """
+    steps = [
+        lambda: remove_files(case_dir, prefix="log"),
+        lambda: remove_file(err_file),
+        lambda: remove_file(out_file),
+        lambda: remove_numeric_folders(case_dir),
+    ]
+    with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+        # list() re-raises the first failure from any step
+        list(executor.map(lambda step: step(), steps))
+
+
 def run_allrun_and_collect_errors(
     case_dir: str,
     timeout: int = 3600,
@@ -49,16 +70,13 @@ def run_allrun_and_collect_errors(
     err_file = os.path.join(case_dir, "Allrun.err")
 
     # Cleanup
-    remove_files(case_dir, prefix="log")
-    remove_file(err_file)
-    remove_file(out_file)
-    remove_numeric_folders(case_dir)
+    _cleanup_case(case_dir, out_file, err_file)
 
     last_error_logs = []
 
     # Run with retries
     for attempt in range(1, max_retries + 1):
-        print(f"Running Allrun (attempt {attempt}/{max_retries})")
+        logger.info("Running Allrun (attempt %d/%d)", attempt, max_retries)
         run_command(allrun_file_path, out_file, err_file, case_dir, timeout)
 
         # Inspect
@@ -68,11 +86,8 @@ def run_allrun_and_collect_errors(
 
         last_error_logs = error_logs
         if attempt < max_retries:
-            print("Allrun reported errors; retrying after cleanup...")
-            remove_files(case_dir, prefix="log")
-            remove_file(err_file)
-            remove_file(out_file)
-            remove_numeric_folders(case_dir)
+            logger.info("Allrun reported errors; retrying after cleanup...")
+            _cleanup_case(case_dir, out_file, err_file)
 
     return last_error_logs
 
@@ -1,45 +1,90 @@
+import json
 import os
+import re
+import select
+import signal
 import sys
 import subprocess
-from typing import List, Tuple, Optional
-from utils import save_file
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import List, NamedTuple, Tuple, Optional
+from pydantic import BaseModel, Field
+from utils import save_file_atomic, ensure_foam_file
 from . import global_llm_service
 
 
-def ensure_foam_file(case_dir: str) -> str:
-    """
-    Ensure a .foam file exists in the case directory for OpenFOAM visualization.
-    
-    This function creates or updates a .foam file in the specified case directory.
-    The .foam file is required for OpenFOAM visualization tools to recognize
-    the directory as a valid OpenFOAM case.
-    
-    Args:
-        case_dir (str): Directory path containing the OpenFOAM case
-    
-    Returns:
-        str: Name of the .foam file (typically "{case_name}.foam")
-    
-    Raises:
-        OSError: If directory cannot be accessed or file cannot be created
-    
-    Example:
-        >>> foam_name = ensure_foam_file("/path/to/case")
-        >>> print(f"Foam file: {foam_name}")  # "case.foam"
-    """
+class VizScript(BaseModel):
+    code: str = Field(description="Complete, runnable Python script (no markdown fences)")
+
+
+VISUALIZATION_SYSTEM_PROMPT = (
+    "You are an expert in OpenFOAM post-processing and PyVista Python scripting. "
+    "Generate a PyVista script that loads the .foam file, renders geometry colored by requested field, uses coolwarm colormap, and saves a PNG. "
+    "Create the plotter with pv.Plotter(off_screen=True, window_size=[1024, 768]) and draw contours with PyVista/VTK filters "
+    "(e.g. mesh.contour() or mesh.slice()) rather than resampling into matplotlib. "
+    "Compute derived fields (e.g. velocity magnitude) with vectorized NumPy on the arrays from mesh.point_data/cell_data, "
+    "such as np.linalg.norm(U, axis=1); never loop over cells in Python."
+)
+ERROR_FIX_SYSTEM_PROMPT = (
+    "You are an expert in PyVista visualization. Fix the provided script to load the .foam file, render geometry, and save a PNG with colorbar."
+)
+
+
+class VisualizationPaths(NamedTuple):
+    """Paths of one case's visualization artifacts, resolved once per node call."""
+    case_dir: str    # absolute case directory
+    foam_file: str   # .foam file name, relative to case_dir
+    output_png: str  # absolute path of the rendered image
+
+
+def resolve_visualization_paths(case_dir: str, output_png: str = "visualization.png") -> VisualizationPaths:
+    """Resolve the case directory once and make sure its .foam file exists."""
     case_dir = os.path.abspath(case_dir)
-    foam = f"{os.path.basename(case_dir)}.foam"
-    foam_path = os.path.join(case_dir, foam)
-    
-    # Create or update the .foam file
-    if not os.path.exists(foam_path):
-        with open(foam_path, 'w') as f:
-            pass
-    else:
-        # Update timestamp if file exists
-        os.utime(foam_path, None)
-    
-    return foam
+    return VisualizationPaths(
+        case_dir=case_dir,
+        foam_file=ensure_foam_file(case_dir),
+        output_png=os.path.join(case_dir, output_png),
+    )
+
+
+# Failures that no script rewrite can fix: the rendering stack itself is missing,
+# the case cannot be accessed, or there is no interpreter to run the script.
+_UNRECOVERABLE_ERROR_RE = re.compile(
+    r"No module named '(?:pyvista|vtk|vtkmodules)[.']"
+    r"|Permission denied"
+    r"|Python interpreter not found"
+)
+
+
+def is_unrecoverable_error(error_logs: List[str]) -> bool:
+    """True if any error means further LLM attempts cannot succeed."""
+    return any(_UNRECOVERABLE_ERROR_RE.search(str(log)) for log in error_logs)
+
+
+# Characters kept from the end of each error log embedded in an LLM prompt.
+ERROR_TAIL_CHARS = 4000
+
+
+def _format_error_tail(error_logs: List[str], max_logs: int = 2) -> str:
+    """Last max_logs error logs as raw text, each cut to its final ERROR_TAIL_CHARS.
+
+    Embedding the list itself would use its repr, escaping every newline.
+    """
+    return "\n---\n".join(str(log)[-ERROR_TAIL_CHARS:] for log in error_logs[-max_logs:])
+
+
+def build_plot_configs(field_name: str, output_path: str) -> List[dict]:
+    """Plot config entries recorded in the state for one rendered PyVista image."""
+    return [{
+        "plot_type": "pyvista",
+        "field_name": field_name,
+        "time_step": "latest",
+        "output_format": "png",
+        "output_path": output_path,
+    }]
 
 
 def generate_pyvista_script(
@@ -76,18 +121,126 @@ def generate_pyvista_script(
         ... )
         >>> print("Generated PyVista script")
     """
-    system_prompt = (
-        "You are an expert in OpenFOAM post-processing and PyVista Python scripting. "
-        "Generate a PyVista script that loads the .foam file, renders geometry colored by requested field, uses coolwarm colormap, and saves a PNG. "
-        "Return ONLY Python code, no markdown."
-    )
     prompt = (
         f"<case_directory>{case_dir}</case_directory>\n"
         f"<foam_file>{foam_file}</foam_file>\n"
         f"<visualization_requirements>{user_requirement}</visualization_requirements>\n"
-        f"<previous_errors>{previous_errors}</previous_errors>\n"
+        f"<previous_errors>{_format_error_tail(previous_errors)}</previous_errors>\n"
     )
-    return global_llm_service.invoke(prompt, system_prompt)
+    return global_llm_service.invoke(
+        prompt,
+        VISUALIZATION_SYSTEM_PROMPT,
+        pydantic_obj=VizScript,
+        use_cache=True,
+    ).code
+
+
+# Lines of stdout/stderr kept per stream from a visualization run; older output is dropped.
+OUTPUT_TAIL_LINES = 256
+
+
+def _drain(stream, tail: deque) -> None:
+    for line in iter(stream.readline, b""):
+        tail.append(line)
+    stream.close()
+
+
+def _run_with_tail(cmd: List[str], cwd: str, timeout_s: int) -> Tuple[Optional[int], str, str]:
+    """Run cmd keeping only the last OUTPUT_TAIL_LINES lines of stdout and stderr.
+
+    Returns (returncode, stdout_tail, stderr_tail); returncode is None if the
+    process was killed after timeout_s.
+    """
+    out_tail: deque = deque(maxlen=OUTPUT_TAIL_LINES)
+    err_tail: deque = deque(maxlen=OUTPUT_TAIL_LINES)
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    readers = [
+        threading.Thread(target=_drain, args=(proc.stdout, out_tail), daemon=True),
+        threading.Thread(target=_drain, args=(proc.stderr, err_tail), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+    try:
+        returncode = proc.wait(timeout=timeout_s)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        returncode = None
+    for reader in readers:
+        reader.join()
+    return (
+        returncode,
+        b"".join(out_tail).decode(errors="replace"),
+        b"".join(err_tail).decode(errors="replace"),
+    )
+
+
+# Long-lived viz_worker.py process (see that module) and the lock serializing its requests.
+_WORKER: Optional[subprocess.Popen] = None
+_WORKER_LOCK = threading.Lock()
+_WORKER_SCRIPT = str(Path(__file__).resolve().parent.parent / "viz_worker.py")
+
+
+def _worker() -> subprocess.Popen:
+    """Start (or restart) the persistent worker; caller holds _WORKER_LOCK."""
+    global _WORKER
+    if _WORKER is None or _WORKER.poll() is not None:
+        _WORKER = subprocess.Popen(
+            [sys.executable, _WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            bufsize=0,
+        )
+    return _WORKER
+
+
+def _read_reply(worker: subprocess.Popen, timeout_s: Optional[float]) -> Optional[dict]:
+    """Read one JSON reply line from the worker; None on timeout."""
+    fd = worker.stdout.fileno()
+    deadline = None if timeout_s is None else time.monotonic() + timeout_s
+    line = b""
+    while not line.endswith(b"\n"):
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not select.select([fd], [], [], remaining)[0]:
+            return None
+        # One byte at a time, so nothing beyond this line is consumed.
+        chunk = os.read(fd, 1)
+        if not chunk:
+            raise RuntimeError("visualization worker exited unexpectedly")
+        line += chunk
+    return json.loads(line)
+
+
+def _tail_file(path: str) -> str:
+    try:
+        with open(path, "rb") as f:
+            return b"".join(deque(f, maxlen=OUTPUT_TAIL_LINES)).decode(errors="replace")
+    except FileNotFoundError:
+        return ""
+
+
+def _run_in_worker(script_path: str, cwd: str, timeout_s: int) -> Tuple[Optional[int], str, str]:
+    """Same contract as _run_with_tail, but the script runs in a child forked
+    from a long-lived viz_worker.py process that has already imported
+    PyVista/VTK, so retries skip the interpreter and import startup. Each
+    script still runs in its own process.
+    """
+    with tempfile.TemporaryDirectory() as tmp, _WORKER_LOCK:
+        out_path = os.path.join(tmp, "stdout")
+        err_path = os.path.join(tmp, "stderr")
+        worker = _worker()
+        request = {"script": script_path, "cwd": cwd, "out": out_path, "err": err_path}
+        worker.stdin.write((json.dumps(request) + "\n").encode())
+        pid = _read_reply(worker, None)["pid"]
+        reply = _read_reply(worker, timeout_s)
+        returncode = None if reply is None else reply["returncode"]
+        if reply is None:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            _read_reply(worker, None)  # the worker reaps the child and reports it
+        return returncode, _tail_file(out_path), _tail_file(err_path)
 
 
 def run_pyvista_script(
@@ -97,28 +250,42 @@ def run_pyvista_script(
     filename: str = "visualization.py",
     expected_png: Optional[str] = None,
     timeout_s: int = 180,
+    persistent_worker: bool = False,
 ) -> Tuple[bool, str, List[str]]:
     """Run a generated visualization script deterministically.
 
     Key behaviors (to avoid flaky bugs):
       - If expected_png is provided, we only consider success if that file exists after execution.
       - Apply a timeout so headless/VTK hangs don't block forever.
+      - Only the tail of stdout/stderr is kept, so verbose VTK output cannot grow memory unbounded.
+      - With persistent_worker, the script is forked from a long-lived worker with PyVista preloaded (POSIX only).
     """
     case_dir = os.path.abspath(case_dir)
     script_path = os.path.join(case_dir, filename)
-    save_file(script_path, script)
+    save_file_atomic(script_path, script, fsync=False)
 
     expected_png_abs = os.path.abspath(os.path.join(case_dir, expected_png)) if expected_png else None
 
     try:
-        completed = subprocess.run(
-            [sys.executable, script_path],
-            cwd=case_dir,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=timeout_s,
-        )
+        if persistent_worker:
+            returncode, out, err = _run_in_worker(script_path, case_dir, timeout_s)
+        else:
+            returncode, out, err = _run_with_tail([sys.executable, script_path], case_dir, timeout_s)
+
+        if returncode is None:
+            return False, "", [
+                f"PyVista script timed out after {timeout_s}s",
+                f"STDOUT:\n{out}",
+                f"STDERR:\n{err}",
+            ]
+
+        if returncode != 0:
+            error_msg = (
+                f"PyVista script execution failed (exit code {returncode})\n"
+                f"STDOUT:\n{out}\n"
+                f"STDERR:\n{err}"
+            )
+            return False, "", [error_msg]
 
         if expected_png_abs:
             if os.path.exists(expected_png_abs) and os.path.getsize(expected_png_abs) > 0:
@@ -133,25 +300,6 @@ def run_pyvista_script(
             "Visualization script executed but no expected_png was specified; please pass expected_png for deterministic artifact detection"
         ]
 
-    except subprocess.TimeoutExpired as e:
-        out = e.stdout.decode() if isinstance(e.stdout, bytes) else str(e.stdout)
-        err = e.stderr.decode() if isinstance(e.stderr, bytes) else str(e.stderr)
-        return False, "", [
-            f"PyVista script timed out after {timeout_s}s",
-            f"STDOUT:\n{out}",
-            f"STDERR:\n{err}",
-        ]
-
-    except subprocess.CalledProcessError as e:
-        err = e.stderr.decode() if isinstance(e.stderr, bytes) else str(e.stderr)
-        out = e.stdout.decode() if isinstance(e.stdout, bytes) else str(e.stdout)
-        error_msg = (
-            f"PyVista script execution failed (exit code {e.returncode})\n"
-            f"STDOUT:\n{out}\n"
-            f"STDERR:\n{err}"
-        )
-        return False, "", [error_msg]
-
     except FileNotFoundError:
         return False, "", [f"Python interpreter not found: {sys.executable}"]
 
@@ -160,15 +308,17 @@ def run_pyvista_script(
 
 
 def fix_pyvista_script(foam_file: str, original_script: str, error_logs: List[str]) -> str:
-    system_prompt = (
-        "You are an expert in PyVista visualization. Fix the provided script to load the .foam file, render geometry, and save a PNG with colorbar. Return ONLY Python code."
-    )
     prompt = (
-        f"<error_logs>{error_logs}</error_logs>\n"
+        f"<error_logs>{_format_error_tail(error_logs)}</error_logs>\n"
         f"<foam_file>{foam_file}</foam_file>\n"
         f"<original_script>{original_script}</original_script>\n"
     )
-    return global_llm_service.invoke(prompt, system_prompt)
+    return global_llm_service.invoke(
+        prompt,
+        ERROR_FIX_SYSTEM_PROMPT,
+        pydantic_obj=VizScript,
+        use_cache=True,
+    ).code
 
 
 def generate_deterministic_pyvista_script(
@@ -181,7 +331,8 @@ def generate_deterministic_pyvista_script(
 
     Goals:
       - Works in headless environments (off-screen)
-      - Always writes to output_png (relative to case_dir)
+      - Always writes to output_png (the absolute VisualizationPaths.output_png; a
+        relative path would resolve against the script's cwd, the case directory)
       - Tries to color by field_preference, but falls back to any available scalar
     """
     # Note: keep this as a plain string (no f-strings with user-provided code).
@@ -256,7 +407,7 @@ if scalar_name is None:
     except Exception:
         scalar_name = None
 
-plotter = pv.Plotter(off_screen=True)
+plotter = pv.Plotter(off_screen=True, window_size=[1024, 768])
 plotter.set_background('white')
 
 if scalar_name is not None:
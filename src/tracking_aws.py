@@ -10,27 +10,50 @@ import tracking_aws
 bedrock_runtime = tracking_aws.new_default_client()
 ```
 
-Your usage will be tracked in a local file called `usage_nrel_aws.json`.
+Your usage will be tracked in a local file called `usage_nrel_aws.json`,
+one JSON record per call appended after any totals recorded by older versions.
 """
 from __future__ import annotations
 from math import nan
-import itertools
+import atexit
+import hashlib
 import os
+import threading
+import time
 import io
 import json
 import pathlib
 from typing import Union, Dict
 import pathlib
-from typing import Any
+from typing import Any, List, Tuple
+from collections import Counter, OrderedDict
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
+from botocore.config import Config as BotoConfig
+
+try:  # optional: faster (de)serialization of the usage records
+    import orjson
+except ImportError:
+    orjson = None
 
 
 
 Usage =  Dict[str, Union[int, float]]   # TODO: could have used Counter class
 default_usage_file = pathlib.Path("usage_nrel_aws.json")
 
+# Running totals per usage file, kept in memory. The per-call records are
+# appended to the file every `flush_every` calls (by default after each call),
+# on `flush_usage()` and at interpreter exit.
+_usage_lock = threading.Lock()
+_usage_cache: Dict[pathlib.Path, Usage] = {}
+_pending_records: Dict[pathlib.Path, List[Dict[str, Any]]] = {}
+# (mtime_ns, totals) of usage files read from disk
+_file_totals: Dict[pathlib.Path, Tuple[int, Usage]] = {}
+# Per-record fields that are not summed into the totals
+_RECORD_METADATA = {"ts", "model", "latency"}
+
 CLAUDE_3_5_HAIKU = 'arn:aws:bedrock:us-west-2:991404956194:application-inference-profile/g47vfd2xvs5w'
 CLAUDE_3_5_SONNET = 'arn:aws:bedrock:us-west-2:991404956194:application-inference-profile/56i8iq1vib3e'
 CLAUDE_4_SONNET = 'arn:aws:bedrock:us-west-2:991404956194:application-inference-profile/f6tueltt82a2'
@@ -50,6 +73,26 @@ pricing = {   # $ per 1,000 tokens
 default_model = CLAUDE_3_5_HAIKU
 default_eval_model = CLAUDE_3_5_HAIKU
 
+# Bedrock latency-optimized inference.  Calls to these models are sent with
+# latency "optimized"; setting `default_latency` to "standard" (e.g. via
+# `use_model(latency='standard')`) opts them out.  Other models never get a
+# latency setting, since Bedrock rejects "optimized" for them.  Bedrock falls
+# back to standard latency when the optimized quota is exhausted, so the latency that
+# actually served each call is stored in its usage record.
+latency_optimized_models = {CLAUDE_3_5_HAIKU}
+default_latency: str | None = None
+
+# Shared by every client built by `new_default_client()`: keep-alive
+# connections, a pool large enough for parallel file generation, and
+# adaptive client-side retries for throttling.
+_client_config = BotoConfig(
+    tcp_keepalive=True,
+    max_pool_connections=32,
+    retries={'mode': 'adaptive', 'max_attempts': 5},
+)
+_session: boto3.Session | None = None
+default_client = None
+
 # A context manager that lets you temporarily change the default models
 # during a block of code.  You can write things like
 #     with use_model('arn:aws:bedrock:us-west-2:991404956194:application-inference-profile/g47vfd2xvs5w'):
@@ -57,25 +100,125 @@ default_eval_model = CLAUDE_3_5_HAIKU
 # 
 #     with use_model(eval_model='arn:aws:bedrock:us-west-2:991404956194:application-inference-profile/g47vfd2xvs5w'):
 #        ...
+#
+#     with use_model(latency='standard'):
+#        ...
 @contextmanager
-def use_model(model: str = default_model, eval_model: str = default_eval_model):
-    global default_model, default_eval_model
-    save_model, save_eval_model = default_model, default_eval_model
-    default_model, default_eval_model = model, eval_model
+def use_model(model: str = default_model, eval_model: str = default_eval_model,
+              latency: str | None = None):
+    global default_model, default_eval_model, default_latency
+    if latency not in (None, "standard"):
+        raise ValueError(f"latency can only be overridden to 'standard', not {latency!r}")
+    save_model, save_eval_model, save_latency = default_model, default_eval_model, default_latency
+    default_model, default_eval_model, default_latency = model, eval_model, latency
     try:
         yield
     finally:
-        default_model, default_eval_model = save_model, save_eval_model        
+        default_model, default_eval_model, default_latency = save_model, save_eval_model, save_latency
+
+def _latency_for(model) -> str | None:
+    if model not in latency_optimized_models:
+        return None
+    return default_latency or "optimized"
 
 
-def track_usage(client: boto3.client, path: pathlib.Path = default_usage_file) -> boto3.client:
+class _ResponseCache:
+    """Response bodies of `invoke_model` keyed by (modelId, body).
+
+    The most recent `maxsize` bodies are kept in memory (LRU); when
+    `directory` is set, every body is also written there as `<key>.json`, so
+    evicted entries and later processes can still hit.  Entries older than
+    `ttl` seconds (if set) are ignored.  Bodies are stored serialized, so each
+    hit returns a fresh dict.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None, directory: pathlib.Path | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.directory = pathlib.Path(directory) if directory is not None else None
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self._entries: OrderedDict[str, Tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model, body) -> str | None:
+        """Cache key of a request, or None for bodies that are not str/bytes (e.g. file objects)."""
+        if isinstance(body, str):
+            body = body.encode()
+        if not isinstance(body, (bytes, bytearray)):
+            return None
+        return hashlib.blake2b(str(model).encode() + b"\0" + bytes(body), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._entries.move_to_end(key)
+                    return _loads(entry[1])
+                del self._entries[key]
+        if self.directory is None:
+            return None
+        try:
+            file = self.directory / f"{key}.json"
+            stored_at = file.stat().st_mtime
+            raw = file.read_bytes()
+        except OSError:
+            return None
+        if self._expired(stored_at):
+            return None
+        self._remember(key, stored_at, raw)
+        return _loads(raw)
+
+    def put(self, key: str, body: Dict[str, Any]) -> None:
+        raw = _dumps(body)
+        self._remember(key, time.time(), raw)
+        if self.directory is not None:
+            try:
+                tmp = self.directory / f"{key}.{threading.get_ident()}.tmp"
+                tmp.write_bytes(raw)
+                os.replace(tmp, self.directory / f"{key}.json")
+            except OSError:
+                pass
+
+    def _remember(self, key: str, stored_at: float, raw: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (stored_at, raw)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+
+def default_response_cache_dir() -> pathlib.Path:
+    """`$FOAMAGENT_CACHE_DIR/bedrock` (default `~/.cache/foam-agent/bedrock`)."""
+    root = os.getenv("FOAMAGENT_CACHE_DIR") or str(pathlib.Path.home() / ".cache" / "foam-agent")
+    return pathlib.Path(root) / "bedrock"
+
+
+def track_usage(client: boto3.client, path: pathlib.Path = default_usage_file,
+                flush_every: int = 1, cache_size: int = 0, cache_ttl: float | None = None,
+                cache_dir: pathlib.Path | None = None) -> boto3.client:
     """
     This method modifies (and returns) `client` so that its API calls
-    will log token counts to `path`. If the file does not exist it
-    will be created after the first API call. If the file exists the new 
-    counts will be added to it.  
+    will log token counts to `path`, one JSON line per call (timestamp,
+    model and counts). If the file exists the new records are appended
+    to it. Each record is appended as soon as the call returns; with
+    `flush_every > 1` records are buffered and appended every `flush_every`
+    calls, whenever `flush_usage()` is called, and at interpreter exit, so
+    a crash loses up to `flush_every - 1` records.
+
+    With `cache_size > 0`, identical `invoke_model` requests (same modelId
+    and body) are answered from a response cache instead of calling Bedrock:
+    the last `cache_size` responses are kept in memory and, if `cache_dir` is
+    given (e.g. `default_response_cache_dir()`), on disk; `cache_ttl` expires
+    entries after that many seconds.  A hit records `cache_hits` and the
+    `cost_saved` instead of tokens.
     
-    The `read_usage()` function gets a Usage object from the file, e.g.:
+    The `read_usage()` function sums the records into a Usage object, e.g.:
     {
         "cost": 0.0022136,
         "input_tokens": 16,
@@ -83,26 +226,129 @@ def track_usage(client: boto3.client, path: pathlib.Path = default_usage_file) -
     }
     
     >>> client = boto3.client('bedrock')
-    >>> track_usage(client, "example_usage_file.json")
+    >>> track_usage(client, "example_usage_file.jsonl")
     >>> type(client)
     <class 'botocore.client.BaseClient'>
     
     """
     old_invoke_model = client.invoke_model
+    path = pathlib.Path(path)
+    cache = _ResponseCache(cache_size, cache_ttl, cache_dir) if cache_size > 0 else None
+
+    def request_latency(kwargs, converse=False) -> None:
+        latency = _latency_for(kwargs.get('modelId', None))
+        if latency is None:
+            return
+        if converse:
+            kwargs.setdefault('performanceConfig', {'latency': latency})
+        else:
+            kwargs.setdefault('performanceConfigLatency', latency)
 
     def tracked_invoke_model(*args, **kwargs) -> Any:
+        model = kwargs.get('modelId', None)
+        key = None
+        if cache is not None and 'body' in kwargs:
+            key = cache.key(model, kwargs['body'])
+            cached = cache.get(key) if key is not None else None
+            if cached is not None:
+                saved = cached.get('usage') or {}
+                cost_saved = _token_usage(saved.get('input_tokens', 0), saved.get('output_tokens', 0),
+                                          model=model).get('cost', 0)
+                _add_usage({'cache_hits': 1, 'cost_saved': cost_saved}, path, flush_every, model=model)
+                return cached
+        request_latency(kwargs)
         response = old_invoke_model(*args, **kwargs)
-        old: Usage = read_usage(path)
-        new, response_body = get_usage(response, model=kwargs.get('modelId', None))
-        _write_usage(_merge_usage(old, new), path)
+        new, response_body = get_usage(response, model=model)
+        if new:
+            _add_usage(new, path, flush_every, model=model,
+                       latency=response.get('performanceConfigLatency'))
+        if key is not None:
+            cache.put(key, response_body)
         return response_body
 
+    def tracked_stream(events, model, usage_from_event, latency=None) -> Any:
+        # Yields the events unchanged; the counts arrive in the final event and
+        # are recorded once the stream ends.
+        counts = None
+        try:
+            for event in events:
+                counts = usage_from_event(event) or counts
+                yield event
+        finally:
+            if counts:
+                _add_usage(_token_usage(*counts, model=model), path, flush_every, model=model, latency=latency)
+
+    def tracked_invoke_model_with_response_stream(*args, **kwargs) -> Any:
+        request_latency(kwargs)
+        response = old_invoke_model_with_response_stream(*args, **kwargs)
+        response['body'] = tracked_stream(response['body'], kwargs.get('modelId', None), _invoke_stream_event_usage,
+                                          latency=response.get('performanceConfigLatency'))
+        return response
+
+    def tracked_converse(*args, **kwargs) -> Any:
+        request_latency(kwargs, converse=True)
+        response = old_converse(*args, **kwargs)
+        counts = _converse_event_usage(response)
+        if counts:
+            model = kwargs.get('modelId', None)
+            _add_usage(_token_usage(*counts, model=model), path, flush_every, model=model,
+                       latency=response.get('performanceConfig', {}).get('latency'))
+        return response
+
+    def tracked_converse_stream(*args, **kwargs) -> Any:
+        request_latency(kwargs, converse=True)
+        response = old_converse_stream(*args, **kwargs)
+        response['stream'] = tracked_stream(response['stream'], kwargs.get('modelId', None), _converse_stream_event_usage)
+        return response
+
     client.invoke_model = tracked_invoke_model  # type:ignore
+    # ChatBedrockConverse (utils.LLMService) calls converse / converse_stream.
+    old_invoke_model_with_response_stream = getattr(client, 'invoke_model_with_response_stream', None)
+    if old_invoke_model_with_response_stream is not None:
+        client.invoke_model_with_response_stream = tracked_invoke_model_with_response_stream  # type:ignore
+    old_converse = getattr(client, 'converse', None)
+    if old_converse is not None:
+        client.converse = tracked_converse  # type:ignore
+    old_converse_stream = getattr(client, 'converse_stream', None)
+    if old_converse_stream is not None:
+        client.converse_stream = tracked_converse_stream  # type:ignore
     return client
 
+def _token_usage(input_tokens: int, output_tokens: int, model=None) -> Usage:
+    """Usage of one call, with a cost field when the model's prices are known."""
+    usage: Usage = {'input_tokens': input_tokens, 'output_tokens': output_tokens}
+    costs = pricing.get(model)
+    if costs is not None:
+        usage['cost'] = (input_tokens * costs['input'] + output_tokens * costs['output']) / 1_000
+    return usage
+
+def _invoke_stream_event_usage(event) -> Tuple[int, int] | None:
+    """Token counts from the final chunk of an invoke_model_with_response_stream body."""
+    data = event.get('chunk', {}).get('bytes', b'')
+    if b'amazon-bedrock-invocationMetrics' not in data:   # skip parsing content chunks
+        return None
+    metrics = _loads(data)['amazon-bedrock-invocationMetrics']
+    return metrics['inputTokenCount'], metrics['outputTokenCount']
+
+def _converse_event_usage(response) -> Tuple[int, int] | None:
+    usage = response.get('usage')
+    if not usage:
+        return None
+    return usage['inputTokens'], usage['outputTokens']
+
+def _converse_stream_event_usage(event) -> Tuple[int, int] | None:
+    """Token counts from the `metadata` event of a converse_stream."""
+    return _converse_event_usage(event.get('metadata', {}))
+
 def get_usage(response, model=None) -> Usage:
-    """Extract usage info from an AWS Bedrock response."""
-    response_body = json.loads(response['body'].read().decode())
+    """Extract usage info from an AWS Bedrock response.
+
+    The body is parsed once, straight from bytes, and returned alongside the
+    usage. A body without a `usage` field yields an empty Usage.
+    """
+    response_body = _loads(response['body'].read())
+    if 'usage' not in response_body:
+        return {}, response_body
     usage: Usage = {'input_tokens': response_body['usage']['input_tokens'],
                     'output_tokens': response_body['usage']['output_tokens']}
 
@@ -110,7 +356,7 @@ def get_usage(response, model=None) -> Usage:
     try: 
         costs = pricing[model]       # model name passed in request (may be alias)
     except KeyError:
-        raise ValueError(f"Don't know prices for model {model} or {response.model}")
+        raise ValueError(f"Don't know prices for model {model}")
 
     cost = (  usage.get('input_tokens', 0)     * costs['input']
             + usage.get('output_tokens', 0) * costs['output']) / 1_000
@@ -118,28 +364,123 @@ def get_usage(response, model=None) -> Usage:
     return usage, response_body
 
 def read_usage(path: pathlib.Path = default_usage_file) -> Usage:
-    """Retrieve total usage logged in a file."""
-    if os.path.exists(path):
-        with open(path, "rt") as f:
-            return json.load(f)
-    else:
+    """Retrieve total usage logged in a file, including calls not yet flushed."""
+    with _usage_lock:
+        cached = _usage_cache.get(pathlib.Path(path))
+        if cached is not None:
+            return dict(cached)
+    return _read_usage_file(path)
+
+def _read_usage_file(path: pathlib.Path) -> Usage:
+    """Sum the numeric fields of all records in a JSONL usage file.
+
+    The result is cached per path until the file's mtime changes. A legacy
+    file holding an indented totals dict is read as one record, followed by
+    any JSONL records appended to it since.
+    """
+    path = pathlib.Path(path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
         return {}
+    cached = _file_totals.get(path)
+    if cached is not None and cached[0] == mtime:
+        return dict(cached[1])
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        records = [_loads(line) for line in data.splitlines() if line.strip()]
+    except json.JSONDecodeError:   # orjson's error subclasses it
+        # Legacy file: an indented totals dict, possibly followed by the
+        # JSONL records appended since (the first one on the dict's last line).
+        text = data.decode()
+        legacy, end = json.JSONDecoder().raw_decode(text, len(text) - len(text.lstrip()))
+        records = [legacy] + [_loads(line) for line in text[end:].splitlines() if line.strip()]
+    totals: Counter = Counter()
+    for record in records:
+        _add_record(totals, record)
+    _file_totals[path] = (mtime, dict(totals))
+    return dict(totals)
+
+def _add_record(totals: Counter, record: Dict[str, Any]) -> None:
+    for k, v in record.items():
+        if k not in _RECORD_METADATA and isinstance(v, (int, float)):
+            totals[k] += v
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+def _write_usage(records: List[Dict[str, Any]], path: pathlib.Path):
+    with open(path, "ab") as f:
+        f.write(b"".join(_dumps(r) + b"\n" for r in records))
+
+def _add_usage(new: Usage, path: pathlib.Path, flush_every: int, model: str | None = None,
+               latency: str | None = None) -> None:
+    """Add `new` to the in-memory totals for `path`; flush every `flush_every` calls."""
+    record = {"ts": time.time(), "model": model, **new}
+    if latency is not None:
+        record["latency"] = latency
+    with _usage_lock:
+        totals = _usage_cache.get(path)
+        if totals is None:
+            totals = _usage_cache[path] = _read_usage_file(path)
+        for k, v in new.items():
+            totals[k] = totals.get(k, 0) + v
+        pending = _pending_records.setdefault(path, [])
+        pending.append(record)
+        if len(pending) >= flush_every:
+            _flush(path)
 
-def _write_usage(u: Usage, path: pathlib.Path):
-    with open(path, "wt") as f:
-        json.dump(u, f, indent=4)
+def _flush(path: pathlib.Path) -> None:
+    # caller holds _usage_lock
+    pending = _pending_records.get(path)
+    if pending:
+        _write_usage(pending, path)
+        pending.clear()
 
-def _merge_usage(u1: Usage, u2: Usage) -> Usage:
-    return {k: u1.get(k, 0) + u2.get(k, 0) for k in itertools.chain(u1,u2)}
+def flush_usage(path: pathlib.Path | None = None) -> None:
+    """Append the pending usage records to disk (for `path`, or for every tracked file)."""
+    with _usage_lock:
+        for p in ([pathlib.Path(path)] if path is not None else list(_pending_records)):
+            _flush(p)
+
+atexit.register(flush_usage)
      
-def new_default_client(default='boto3') -> boto3.client:
+def new_default_client(default='boto3', refresh: bool = False) -> boto3.client:
     """Set the `default_client` to a new tracked client, based on the current
-    aws credentials. If your credentials change you should call this method again."""
-    global default_client
-    default_client = track_usage(boto3.client('bedrock-runtime', region_name='us-west-2'))  # create a client with default args, and modify it 
+    aws credentials. Later calls return the same client, so its connection
+    pool (keep-alive) is reused; if your credentials change, call this method
+    again with `refresh=True`."""
+    global default_client, _session
+    if default_client is not None and not refresh:
+        return default_client
+    if _session is None or refresh:
+        _session = boto3.Session(region_name='us-west-2')
+    default_client = track_usage(_session.client('bedrock-runtime', config=_client_config))  # create a client, and modify it 
                                                    # so that it will store its usage in a local file 
     return default_client
 
+def invoke_many(requests: List[Dict[str, Any]], client: boto3.client | None = None,
+                max_workers: int = 8) -> List[Any]:
+    """Run several `invoke_model` calls concurrently and return their response
+    bodies in request order.
+
+    Each element of `requests` holds the keyword arguments of one
+    `invoke_model` call (`modelId`, `body`, ...).  At most `max_workers` calls
+    are in flight at once, so keep it within your account's request quota and
+    below the client's connection pool size (32).  Usage is tracked as usual,
+    e.g.:
+
+        bodies = invoke_many([{'modelId': default_model, 'body': json.dumps(r)} for r in batch])
+    """
+    client = client or new_default_client()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda kwargs: client.invoke_model(**kwargs), requests))
+
 #new_default_client()       # set `default_client` right away when importing this module
     
 if __name__ == "__main__":
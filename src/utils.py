@@ -3,8 +3,8 @@ import re
 import subprocess
 import os
 import signal
-from typing import Optional, Any, Type, TypedDict, List, Dict
-from pydantic import BaseModel, Field
+from typing import Optional, Any, Type, TypedDict, List, Dict, Iterable, Tuple
+from pydantic import BaseModel, ConfigDict, Field
 from langchain.chat_models import init_chat_model
 from langchain_community.vectorstores import FAISS
 from langchain_openai.embeddings import OpenAIEmbeddings
@@ -18,6 +18,19 @@ import time
 import random
 from botocore.exceptions import ClientError
 import shutil
+import hashlib
+import functools
+import tempfile
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+import numpy as np
+import faiss
 from config import Config
 from langchain_ollama import ChatOllama
 try:
@@ -91,17 +104,121 @@ def load_faiss_dbs(config: Optional[Config] = None):
 
 
 # Default DB cache (uses default Config()). If you change embedding settings at runtime,
-# call load_faiss_dbs(custom_config) and replace FAISS_DB_CACHE.
+# call load_faiss_dbs(custom_config), replace FAISS_DB_CACHE and clear the retrieval
+# memo with _retrieve_faiss_cached.cache_clear().
 FAISS_DB_CACHE = load_faiss_dbs()
 
+
+# Anthropic's minimum cacheable prompt prefix is 1024 tokens; at roughly four
+# characters per token, shorter prefixes are not worth a cache breakpoint.
+MIN_CACHEABLE_PREFIX_CHARS = 4096
+
+
+def get_cache_dir(namespace: str) -> Path:
+    """Return (and create) a persistent cache directory for ``namespace``.
+
+    The root defaults to ``~/.cache/foam-agent`` and can be moved with the
+    ``FOAMAGENT_CACHE_DIR`` environment variable.
+    """
+    root = os.getenv("FOAMAGENT_CACHE_DIR") or str(Path.home() / ".cache" / "foam-agent")
+    path = Path(root) / namespace
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _embedding_model_name(embeddings: Any) -> str:
+    for attr in ("model_name", "model"):
+        value = getattr(embeddings, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    return type(embeddings).__name__
+
+
+# Most query vectors kept in the on-disk embedding cache; the least recently
+# used ones are deleted beyond that (a few KB each, e.g. ~16 MB at 1024 dims).
+EMBEDDING_CACHE_MAX_FILES = 4096
+
+
+def _prune_cache_dir(cache_dir: Path, max_files: int) -> None:
+    """Delete the least recently used ``.npy`` files beyond ``max_files``."""
+    try:
+        with os.scandir(cache_dir) as entries:
+            files = [(e.stat().st_mtime_ns, e.path) for e in entries if e.name.endswith(".npy")]
+    except OSError:
+        return
+    if len(files) <= max_files:
+        return
+    files.sort()
+    for _, path in files[:len(files) - max_files]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def embed_queries_cached(vectordb: FAISS, queries: List[str]) -> np.ndarray:
+    """Embed ``queries`` with the store's embedding model, reusing on-disk vectors.
+
+    Vectors are cached as ``<sha256(model, query)>.npy`` under the
+    ``embeddings`` cache directory, so repeated lookups (e.g. command help for
+    blockMesh, icoFoam, ...) skip the embedding model even across runs. The
+    cache holds at most EMBEDDING_CACHE_MAX_FILES vectors, evicting the least
+    recently used.
+    """
+    embeddings = vectordb.embeddings
+    model_name = _embedding_model_name(embeddings if embeddings is not None else vectordb.embedding_function)
+    cache_dir = get_cache_dir("embeddings")
+
+    cache_paths = [
+        cache_dir / (hashlib.sha256(f"{model_name}\n{q}".encode("utf-8")).hexdigest() + ".npy")
+        for q in queries
+    ]
+    vectors: List[Optional[np.ndarray]] = []
+    for path in cache_paths:
+        try:
+            vectors.append(np.load(path))
+            os.utime(path)  # mark as recently used for eviction
+        except (OSError, ValueError, EOFError):
+            vectors.append(None)
+
+    missing = [i for i, vec in enumerate(vectors) if vec is None]
+    if missing:
+        texts = [queries[i] for i in missing]
+        if embeddings is not None:
+            new_vectors = embeddings.embed_documents(texts)
+        else:
+            new_vectors = [vectordb.embedding_function(t) for t in texts]
+        for i, vec in zip(missing, new_vectors):
+            vec = np.asarray(vec, dtype=np.float32)
+            vectors[i] = vec
+            try:
+                with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False) as f:
+                    np.save(f, vec)
+                os.replace(f.name, cache_paths[i])
+            except OSError:
+                pass
+        _prune_cache_dir(cache_dir, EMBEDDING_CACHE_MAX_FILES)
+
+    return np.vstack(vectors).astype(np.float32, copy=False)
+
 class FoamfilePydantic(BaseModel):
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=False)
+
     file_name: str = Field(description="Name of the OpenFOAM input file")
     folder_name: str = Field(description="Folder where the foamfile should be stored")
     content: str = Field(description="Content of the OpenFOAM file, written in OpenFOAM dictionary format")
 
 class FoamPydantic(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     list_foamfile: List[FoamfilePydantic] = Field(description="List of OpenFOAM configuration files")
 
+def serialize_foamfiles(foamfiles: Any) -> str:
+    """Render foamfiles for a prompt (pydantic's compiled JSON serializer when available)."""
+    if hasattr(foamfiles, "model_dump_json"):
+        return foamfiles.model_dump_json()
+    return str(foamfiles)
+
 class ResponseWithThinkPydantic(BaseModel):
     think: str = Field(description="Thought process of the LLM")
     response: str = Field(description="Response of the LLM")
@@ -143,6 +260,14 @@ class _CodexResponsesWrapper:
         self._account_id = account_id
         self._instructions = instructions
         self._stream = stream
+        # Keep-alive connection pool reused across the calls made through this
+        # wrapper, so each call after the first skips the TCP/TLS handshake.
+        # (The parallel input-writer modes build one LLMService per file, so
+        # each of those gets its own session.)
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=16)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
         # Token counting (best-effort). Exact tokenization may differ by model.
         # We default to a modern tokenizer; adjust if you need model-specific counting.
         try:
@@ -292,7 +417,7 @@ class _CodexResponsesWrapper:
         # `HTTPSConnectionPool ... Read timed out. (read timeout=60)` and
         # failing the workflow. Allow operator override via env var.
         timeout = int(os.environ.get("FOAMAGENT_HTTP_TIMEOUT", "300"))
-        r = requests.post(url, headers=headers, json=payload, timeout=timeout, stream=bool(self._stream))
+        r = self._session.post(url, headers=headers, json=payload, timeout=timeout, stream=bool(self._stream))
 
         # If we get an error, surface the response body to aid debugging.
         if not r.ok:
@@ -470,6 +595,8 @@ class LLMService:
         self.temperature = getattr(config, "temperature", 0)
         self.model_provider = getattr(config, "model_provider", "openai")
         self._config = config
+        # Opt-in on-disk response cache, consulted only by invoke(..., use_cache=True)
+        self.response_cache_enabled = bool(getattr(config, "llm_response_cache", False))
         
         # Initialize statistics
         self.total_calls = 0
@@ -618,11 +745,40 @@ class LLMService:
         
         return retry_count
 
+    def _system_message(self, system_prompt: str, cacheable_system_prefix: Optional[str]) -> dict:
+        """Build the system message, marking a constant prefix as cacheable.
+
+        Anthropic only reuses cached prompt prefixes up to an explicit
+        ``cache_control`` breakpoint, so the constant head of the system prompt
+        is sent as its own block with a breakpoint. Anthropic ignores
+        breakpoints on prefixes under 1024 tokens, so shorter prefixes are sent
+        unmarked. Other providers cache shared prefixes automatically and get
+        the plain string.
+        """
+        if (
+            cacheable_system_prefix
+            and len(cacheable_system_prefix) >= MIN_CACHEABLE_PREFIX_CHARS
+            and self.model_provider.lower() == "anthropic"
+            and system_prompt.startswith(cacheable_system_prefix)
+        ):
+            blocks = [{
+                "type": "text",
+                "text": cacheable_system_prefix,
+                "cache_control": {"type": "ephemeral"},
+            }]
+            suffix = system_prompt[len(cacheable_system_prefix):]
+            if suffix:
+                blocks.append({"type": "text", "text": suffix})
+            return {"role": "system", "content": blocks}
+        return {"role": "system", "content": system_prompt}
+
     def invoke(self,
               user_prompt: str, 
               system_prompt: Optional[str] = None, 
               pydantic_obj: Optional[Type[BaseModel]] = None,
-              max_retries: int = 10) -> Any:
+              max_retries: int = 10,
+              cacheable_system_prefix: Optional[str] = None,
+              use_cache: bool = False) -> Any:
         """
         Invoke the LLM with the given prompts and return the response.
         
@@ -631,22 +787,85 @@ class LLMService:
             system_prompt: Optional system prompt
             pydantic_obj: Optional Pydantic model for structured output
             max_retries: Maximum number of retries for throttling errors
+            cacheable_system_prefix: Optional constant head of system_prompt that
+                providers with explicit prompt caching should cache
+            use_cache: Reuse a stored response for an identical request when the
+                response cache is enabled in the config (llm_response_cache)
             
         Returns:
             The LLM response with token usage statistics
         """
+        cache_path = None
+        if use_cache and self.response_cache_enabled:
+            cache_path = self._response_cache_path(user_prompt, system_prompt, pydantic_obj)
+            cached = self._load_cached_response(cache_path, pydantic_obj)
+            if cached is not None:
+                return cached
+
+        response = self._invoke_uncached(
+            user_prompt, system_prompt, pydantic_obj, max_retries, cacheable_system_prefix
+        )
+        if cache_path is not None:
+            self._store_cached_response(cache_path, response, pydantic_obj)
+        return response
+
+    def _response_cache_path(self, user_prompt: str, system_prompt: Optional[str],
+                             pydantic_obj: Optional[Type[BaseModel]]) -> Path:
+        schema = pydantic_obj.__name__ if pydantic_obj else ""
+        key = hashlib.sha256(
+            "\0".join([
+                self.model_provider, self.model_version, str(self.temperature),
+                schema, system_prompt or "", user_prompt,
+            ]).encode("utf-8")
+        ).hexdigest()
+        return get_cache_dir("llm") / f"{key}.json"
+
+    @staticmethod
+    def _load_cached_response(cache_path: Path, pydantic_obj: Optional[Type[BaseModel]]) -> Any:
+        import json
+
+        try:
+            raw = cache_path.read_text(encoding="utf-8")
+            if pydantic_obj:
+                # Parse and validate in one pass in pydantic-core
+                return pydantic_obj.model_validate_json(raw)
+            return json.loads(raw)["response"]
+        except (OSError, ValueError, KeyError):
+            # Missing or unreadable entry (pydantic's ValidationError is a ValueError)
+            return None
+
+    @staticmethod
+    def _store_cached_response(cache_path: Path, response: Any,
+                               pydantic_obj: Optional[Type[BaseModel]]) -> None:
+        import json
+
+        try:
+            if pydantic_obj:
+                content = response.model_dump_json()
+            else:
+                content = json.dumps({"response": response})
+            save_file_atomic(str(cache_path), content)
+        except (OSError, TypeError) as e:
+            print(f"Warning: could not store LLM response cache entry {cache_path}: {e}")
+
+    def _invoke_uncached(self,
+                         user_prompt: str,
+                         system_prompt: Optional[str],
+                         pydantic_obj: Optional[Type[BaseModel]],
+                         max_retries: int,
+                         cacheable_system_prefix: Optional[str]) -> Any:
         self.total_calls += 1
         
+        # Calculate prompt tokens
+        prompt_tokens = self.llm.get_num_tokens(user_prompt)
+        if system_prompt:
+            prompt_tokens += self.llm.get_num_tokens(system_prompt)
+
         messages = []
         if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
+            messages.append(self._system_message(system_prompt, cacheable_system_prefix))
         messages.append({"role": "user", "content": user_prompt})
         
-        # Calculate prompt tokens
-        prompt_tokens = 0
-        for message in messages:
-            prompt_tokens += self.llm.get_num_tokens(message["content"])
-        
         retry_count = 0
         while True:
             try:
@@ -780,6 +999,7 @@ class GraphState(TypedDict):
     # Review and rewrite related fields
     review_analysis: Optional[str]
     rewrite_plan: Optional[dict]
+    review_action: Optional[str]  # "rewrite", "skip" (rerun unchanged) or "halt"
     input_writer_mode: Optional[str]
     similar_case_advice: Optional[dict]
     # Routing decision cache
@@ -798,17 +1018,372 @@ def tokenize(text: str) -> str:
     text = re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', text)
     return text.lower()
 
-def save_file(path: str, content: str) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
+def save_file(path: str, content: str, *, create_dirs: bool = True) -> None:
+    if create_dirs:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, 'w') as f:
         f.write(content)
     print(f"Saved file at {path}")
 
+# Batches at least this large are written from a thread pool so the
+# open/write/close syscalls of independent files overlap; smaller batches
+# are not worth the pool setup.
+CONCURRENT_WRITE_THRESHOLD = 4
+_MAX_WRITE_WORKERS = 8
+
+def _write_one(path: str, content: str) -> None:
+    data = memoryview(content.encode("utf-8"))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+    print(f"Saved file at {path}")
+
+def _last_write_per_path(items: Iterable[tuple]) -> List[tuple]:
+    """Keep one item per path (``item[0]``): the last one, at the path's first position.
+
+    Two writes to the same path must never run concurrently, and the later one
+    is the one the caller expects to end up on disk.
+    """
+    latest: Dict[str, tuple] = {}
+    for item in items:
+        latest[item[0]] = item
+    return list(latest.values())
+
+def _write_files(files: Iterable[Tuple[str, str]], create_dirs: bool) -> List[Tuple[str, OSError]]:
+    """Write ``(path, content)`` pairs; return ``(path, error)`` for each failure."""
+    files = _last_write_per_path(files)
+    if create_dirs:
+        for parent in {os.path.dirname(path) for path, _ in files}:
+            try:
+                os.makedirs(parent, exist_ok=True)
+            except OSError:
+                pass  # surfaces as a write error for the files below it
+
+    def attempt(item: Tuple[str, str]) -> Optional[Tuple[str, OSError]]:
+        try:
+            _write_one(*item)
+        except OSError as e:
+            return (item[0], e)
+        return None
+
+    if len(files) >= CONCURRENT_WRITE_THRESHOLD:
+        with ThreadPoolExecutor(max_workers=min(_MAX_WRITE_WORKERS, len(files))) as executor:
+            results = list(executor.map(attempt, files))
+    else:
+        results = [attempt(item) for item in files]
+    return [r for r in results if r is not None]
+
+def save_files(files: Iterable[Tuple[str, str]], *, create_dirs: bool = True) -> None:
+    """Write a batch of ``(path, content)`` pairs.
+
+    Each parent directory is created once per batch and files are written
+    without a per-file fsync. Every file is attempted; if any fail, an
+    OSError naming the first failure is raised.
+    """
+    errors = _write_files(files, create_dirs)
+    if errors:
+        path, error = errors[0]
+        raise OSError(f"Failed to write {len(errors)} file(s), first: {path}: {error}") from error
+
+# Process umask, read once (os.umask can only be read by setting it).
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def save_file_atomic(path: str, content: str, *, fsync: bool = True) -> None:
+    """Write ``content`` to ``path`` so readers never observe a partial file.
+
+    The content is written to a temporary file in the same directory, flushed
+    and fsynced, then moved into place with ``os.replace``. Use this for files
+    that are consumed by external processes (e.g. ``sbatch``). Pass
+    ``fsync=False`` for scratch files that only need atomicity, not durability.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # A unique temp name, so concurrent writers to the same path don't share one.
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with open(fd, 'w') as f:
+            os.fchmod(f.fileno(), 0o666 & ~_UMASK)  # mkstemp creates 0600; match a plain open()
+            f.write(content)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    print(f"Saved file at {path}")
+
+class AsyncArtifactWriter:
+    """Write files from a background thread so callers don't block on disk I/O.
+
+    ``submit`` queues a ``save_file`` call and returns immediately; ``flush``
+    blocks until every queued write has completed and re-raises the first
+    write error, if any. The worker thread is started lazily and drains
+    whatever has queued up as one ``save_files`` batch.
+
+    Create one writer per operation and use it as a context manager: leaving
+    the block flushes and stops the worker, so queued writes and write errors
+    never leak into another caller's operation.
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[Optional[tuple[str, str, bool]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._errors: List[tuple] = []
+
+    def submit(self, path: str, content: str, create_dirs: bool = True) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="artifact-writer", daemon=True)
+                self._thread.start()
+        self._queue.put((path, content, create_dirs))
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch  # close() was called; write what is left, then exit
+            # Dedupe before splitting by create_dirs, so the two halves can't
+            # both write the same path.
+            writes = _last_write_per_path(item for item in batch if item is not None)
+            for create_dirs in (True, False):
+                items = [(path, content) for path, content, flag in writes if flag == create_dirs]
+                if not items:
+                    continue
+                try:
+                    errors = _write_files(items, create_dirs)
+                except Exception as e:
+                    errors = [(items[0][0], e)]
+                if errors:
+                    with self._lock:
+                        self._errors.extend(errors)
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        self._queue.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            path, error = errors[0]
+            raise OSError(f"Failed to write {len(errors)} file(s), first: {path}: {error}") from error
+
+    def close(self) -> None:
+        """Finish the queued writes, stop the worker thread and raise any write error."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+        self.flush()
+
+    def __enter__(self) -> "AsyncArtifactWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        try:
+            self.close()
+        except OSError as e:
+            if exc_type is None:
+                raise
+            # Don't mask the exception that is already propagating.
+            print(f"Artifact writes failed while handling {exc_type.__name__}: {e}")
+        return False
+
+_HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+def apply_unified_diff(original: str, patch: str) -> str:
+    """Apply a unified diff to ``original`` and return the patched text.
+
+    Hunks are located by their context/removed lines rather than trusting the
+    line numbers in the ``@@`` header (LLM-written diffs are often off by a
+    few lines); the header position is only used to pick the nearest match.
+    Raises ValueError if a hunk does not apply cleanly.
+    """
+    lines = original.splitlines()
+    hunks = []
+    current = None
+    for line in patch.splitlines():
+        header = _HUNK_HEADER_RE.match(line)
+        if header:
+            current = {"start": int(header.group(1)), "old": [], "new": []}
+            hunks.append(current)
+        elif current is None or line.startswith(('--- ', '+++ ', '\\')):
+            continue
+        elif line.startswith('-'):
+            current["old"].append(line[1:])
+        elif line.startswith('+'):
+            current["new"].append(line[1:])
+        else:
+            # Context line; tolerate a missing leading space on blank lines.
+            text = line[1:] if line.startswith(' ') else line
+            current["old"].append(text)
+            current["new"].append(text)
+
+    if not hunks:
+        raise ValueError("Patch contains no hunks")
+
+    offset = 0
+    for hunk in hunks:
+        old, new = hunk["old"], hunk["new"]
+        expected = max(hunk["start"] - 1 + offset, 0)
+        if not old:
+            # Pure insertion: the header start is the line after which to insert.
+            position = min(hunk["start"] + offset, len(lines))
+        else:
+            candidates = [
+                i for i in range(len(lines) - len(old) + 1)
+                if lines[i:i + len(old)] == old
+            ]
+            if not candidates:
+                stripped = [o.rstrip() for o in old]
+                candidates = [
+                    i for i in range(len(lines) - len(old) + 1)
+                    if [l.rstrip() for l in lines[i:i + len(old)]] == stripped
+                ]
+            if not candidates:
+                raise ValueError(f"Hunk starting at line {hunk['start']} does not match the original content")
+            position = min(candidates, key=lambda i: abs(i - expected))
+        lines[position:position + len(old)] = new
+        offset += len(new) - len(old)
+
+    patched = "\n".join(lines)
+    if original.endswith("\n") or not original:
+        patched += "\n"
+    return patched
+
+_BOUNDARY_PATCH_RE = re.compile(r"(?m)^(?P<indent>[ \t]*)(?P<name>\w+)\s*\{(?P<body>[^{}]*)\}")
+
+def _set_dict_entry(body: str, key: str, value: str) -> str:
+    """Set ``key value;`` in a dictionary body, adding it after ``type`` if missing."""
+    entry_re = re.compile(rf"(?m)^([ \t]*{key}[ \t]+)[^;\n]*;")
+    body, n = entry_re.subn(lambda m: f"{m.group(1)}{value};", body, count=1)
+    if n:
+        return body
+    type_line = re.search(r"(?m)^([ \t]*)type[ \t]+[^;\n]*;[^\n]*\n", body)
+    if type_line is None:
+        raise ValueError(f"Cannot place '{key}': patch has no 'type' entry")
+    insert = f"{type_line.group(1)}{key:<16}{value};\n"
+    return body[:type_line.end()] + insert + body[type_line.end():]
+
+def apply_boundary_patch_changes(boundary_content: str, changes: Dict[str, Dict[str, str]]) -> str:
+    """Set entries (e.g. ``type``/``physicalType``) of named patches in a polyMesh boundary file.
+
+    ``changes`` maps a patch name to the entries to set. Everything else in the
+    file is left byte-for-byte unchanged. Raises KeyError if a named patch is
+    not in the file.
+    """
+    remaining = dict(changes)
+
+    def _patch(match: re.Match) -> str:
+        entries = remaining.pop(match.group("name"), None)
+        if not entries:
+            return match.group(0)
+        body = match.group("body")
+        for key, value in entries.items():
+            if value:
+                body = _set_dict_entry(body, key, value)
+        return match.group(0)[:match.start("body") - match.start()] + body + "}"
+
+    patched = _BOUNDARY_PATCH_RE.sub(_patch, boundary_content)
+    if remaining:
+        raise KeyError(f"Patches not found in boundary file: {sorted(remaining)}")
+    return patched
+
+# Linux FICLONE ioctl: make dst share src's extents (btrfs, xfs, ...).
+_FICLONE = 0x40049409
+
+def _reflink(fsrc, fdst) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        return False
+
+def fast_copy(src: str, dst: str) -> None:
+    """Copy ``src`` to ``dst`` with metadata, like ``shutil.copy2``.
+
+    Skips the copy when ``dst`` already matches ``src`` in size and mtime
+    (``copystat`` preserves the mtime, so this is the case after a previous
+    ``fast_copy``). Otherwise tries a FICLONE reflink, then
+    ``os.copy_file_range`` so the data stays in the kernel, and finally falls
+    back to ``shutil.copyfile``, e.g. across devices.
+    """
+    try:
+        src_st, dst_st = os.stat(src), os.stat(dst)
+        if os.path.samestat(src_st, dst_st) or (
+            src_st.st_size == dst_st.st_size and src_st.st_mtime_ns == dst_st.st_mtime_ns
+        ):
+            return
+    except FileNotFoundError:
+        pass
+
+    copied = False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            copied = _reflink(fsrc, fdst)
+            if not copied and hasattr(os, "copy_file_range"):
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if n == 0:
+                        break
+                    remaining -= n
+                copied = remaining == 0
+    except OSError:
+        copied = False
+    if not copied:
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+def ensure_foam_file(case_dir: str) -> str:
+    """
+    Ensure a .foam file exists in the case directory for OpenFOAM visualization.
+    
+    This function creates or updates a .foam file in the specified case directory.
+    The .foam file is required for OpenFOAM visualization tools to recognize
+    the directory as a valid OpenFOAM case.
+    
+    Args:
+        case_dir (str): Directory path containing the OpenFOAM case
+    
+    Returns:
+        str: Name of the .foam file (typically "{case_name}.foam")
+    
+    Raises:
+        OSError: If directory cannot be accessed or file cannot be created
+    
+    Example:
+        >>> foam_name = ensure_foam_file("/path/to/case")
+        >>> print(f"Foam file: {foam_name}")  # "case.foam"
+    """
+    case_dir = os.path.abspath(case_dir)
+    foam = f"{os.path.basename(case_dir)}.foam"
+    # Create the .foam file, or update its timestamp if it already exists
+    Path(case_dir, foam).touch(exist_ok=True)
+    return foam
+
 def read_file(path: str) -> str:
-    if os.path.exists(path):
+    try:
         with open(path, 'r') as f:
             return f.read()
-    return ""
+    except FileNotFoundError:
+        return ""
 
 def list_case_files(case_dir: str) -> str:
     files = [f for f in os.listdir(case_dir) if os.path.isfile(os.path.join(case_dir, f))]
@@ -821,9 +1396,11 @@ def remove_files(directory: str, prefix: str) -> None:
     print(f"Removed files with prefix '{prefix}' in {directory}")
 
 def remove_file(path: str) -> None:
-    if os.path.exists(path):
+    try:
         os.remove(path)
-        print(f"Removed file {path}")
+    except FileNotFoundError:
+        return
+    print(f"Removed file {path}")
 
 def remove_numeric_folders(case_dir: str) -> None:
     """
@@ -833,21 +1410,28 @@ def remove_numeric_folders(case_dir: str) -> None:
     Args:
         case_dir (str): The directory path to process
     """
-    for item in os.listdir(case_dir):
-        item_path = os.path.join(case_dir, item)
-        if os.path.isdir(item_path) and item != "0":
+    # scandir reports the entry type from the directory listing, so large transient
+    # cases with thousands of time folders need no extra stat() per entry.
+    with os.scandir(case_dir) as entries:
+        numeric_dirs = []
+        for entry in entries:
+            if entry.name == "0":
+                continue
             try:
                 # Try to convert to float to check if it's a numeric value
-                float(item)
-                # If conversion succeeds, it's a numeric folder
-                try:
-                    shutil.rmtree(item_path)
-                    print(f"Removed numeric folder: {item_path}")
-                except Exception as e:
-                    print(f"Error removing folder {item_path}: {str(e)}")
+                float(entry.name)
             except ValueError:
                 # Not a numeric value, so we keep this folder
-                pass
+                continue
+            if entry.is_dir():
+                numeric_dirs.append(entry.path)
+
+    for item_path in numeric_dirs:
+        try:
+            shutil.rmtree(item_path)
+            print(f"Removed numeric folder: {item_path}")
+        except Exception as e:
+            print(f"Error removing folder {item_path}: {str(e)}")
 
 
 def scan_case_directory(case_dir: str) -> Dict[str, List[str]]:
@@ -963,37 +1547,64 @@ def run_command(script_path: str, out_file: str, err_file: str, working_dir: str
 
     command = f"source {bashrc_path} && bash {os.path.abspath(script_path)}"
 
+    # The child writes straight into the log files, so long solver output is
+    # never buffered in this process.
+    timed_out = False
     with open(out_file, 'w') as out, open(err_file, 'w') as err:
         process = subprocess.Popen(
             ['bash', "-c", command],
             cwd=working_dir,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            stdout=out,
+            stderr=err,
             stdin=subprocess.DEVNULL,
-            text=True,
             start_new_session=True,
         )
 
         try:
-            stdout, stderr = process.communicate(timeout=max_time_limit)
-            out.write(stdout)
-            err.write(stderr)
+            process.wait(timeout=max_time_limit)
         except subprocess.TimeoutExpired:
-            os.killpg(os.getpgid(process.pid), signal.SIGKILL) 
-            
-            stdout, stderr = process.communicate()
-            timeout_message = (
-                "OpenFOAM execution took too long. "
-                "This case, if set up right, does not require such large execution times.\n"
-            )
-            out.write(timeout_message + stdout)
-            err.write(timeout_message + stderr)
-            print(f"Execution timed out: {script_path}")
-
-    
+            os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+            process.wait()
+            timed_out = True
+
+    if timed_out:
+        timeout_message = (
+            "OpenFOAM execution took too long. "
+            "This case, if set up right, does not require such large execution times.\n"
+        )
+        for path in (out_file, err_file):
+            with open(path, 'a') as f:
+                f.write(timeout_message)
+        print(f"Execution timed out: {script_path}")
 
     print(f"Executed script {script_path}")
 
+# Explicit error report; DOTALL lets the capture run to the end of the log.
+# "FOAM FATAL (IO) ERROR:" banners are covered by the "ERROR:" match.
+_FOAM_ERROR_RE = re.compile(r"ERROR:(.*)", re.DOTALL)
+_ERROR_WORD_RE = re.compile(r"error", re.IGNORECASE)
+# Line OpenFOAM applications print on successful completion
+_END_MARKER_RE = re.compile(r"^\s*End\s*$", re.MULTILINE)
+
+# directory -> (log file signature, error logs) from the last check_foam_errors
+# call, for the most recently checked directories only (error logs can hold
+# whole log tails, and a long-lived server sees many case directories).
+_FOAM_ERRORS_CACHE_MAXSIZE = 32
+_FOAM_ERRORS_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_FOAM_ERRORS_CACHE_LOCK = threading.Lock()
+
+
+def _log_files_signature(directory: str) -> tuple:
+    """Sorted (name, mtime_ns, size) of the log* files directly in ``directory``."""
+    with os.scandir(directory) as entries:
+        stats = []
+        for entry in entries:
+            if entry.name.startswith("log") and entry.is_file():
+                st = entry.stat()
+                stats.append((entry.name, st.st_mtime_ns, st.st_size))
+    return tuple(sorted(stats))
+
+
 def check_foam_errors(directory: str) -> list:
     """Check OpenFOAM log files for errors.
 
@@ -1003,39 +1614,42 @@ def check_foam_errors(directory: str) -> list:
     completion.  Any log missing ``End`` is reported with the last 30 lines
     as error context so the caller can diagnose the crash.
     """
+    # Skip the rescan when no log file was added, removed or modified since
+    # the last call for this directory.
+    signature = _log_files_signature(directory)
+    with _FOAM_ERRORS_CACHE_LOCK:
+        cached = _FOAM_ERRORS_CACHE.get(directory)
+        if cached is not None and cached[0] == signature:
+            _FOAM_ERRORS_CACHE.move_to_end(directory)
+            return [dict(entry) for entry in cached[1]]
+
     error_logs = []
     log_contents = {}  # filename -> content
 
-    # DOTALL mode allows '.' to match newline characters
-    pattern = re.compile(r"ERROR:(.*)", re.DOTALL)
-
-    for file in os.listdir(directory):
-        if file.startswith("log"):
-            filepath = os.path.join(directory, file)
-            try:
-                with open(filepath, 'r') as f:
-                    content = f.read()
-            except (IOError, OSError):
-                error_logs.append({"file": file, "error_content": f"Could not read log file: {filepath}"})
-                continue
+    for file, _, _ in signature:
+        filepath = os.path.join(directory, file)
+        try:
+            with open(filepath, 'r') as f:
+                content = f.read()
+        except (IOError, OSError):
+            error_logs.append({"file": file, "error_content": f"Could not read log file: {filepath}"})
+            continue
 
-            log_contents[file] = content
+        log_contents[file] = content
 
-            match = pattern.search(content)
-            if match:
-                error_content = match.group(0).strip()
-                error_logs.append({"file": file, "error_content": error_content})
-            elif "error" in content.lower():
-                print(f"Warning: file {file} contains 'error' but does not match expected format.")
+        match = _FOAM_ERROR_RE.search(content)
+        if match:
+            error_content = match.group(0).strip()
+            error_logs.append({"file": file, "error_content": error_content})
+        elif _ERROR_WORD_RE.search(content):
+            print(f"Warning: file {file} contains 'error' but does not match expected format.")
 
     # Safety-net: if no explicit ERROR was found, check for missing 'End' marker
     # Check EACH log individually – a successful blockMesh should not mask a
     # crashed solver (e.g. pimpleFoam).
     if not error_logs and log_contents:
-        end_pattern = re.compile(r"^\s*End\s*$", re.MULTILINE)
-
         for file, content in log_contents.items():
-            if not end_pattern.search(content):
+            if not _END_MARKER_RE.search(content):
                 last_lines = "\n".join(content.strip().split("\n")[-30:])
                 error_logs.append({
                     "file": file,
@@ -1045,6 +1659,11 @@ def check_foam_errors(directory: str) -> list:
                     ),
                 })
 
+    with _FOAM_ERRORS_CACHE_LOCK:
+        _FOAM_ERRORS_CACHE[directory] = (signature, [dict(entry) for entry in error_logs])
+        _FOAM_ERRORS_CACHE.move_to_end(directory)
+        while len(_FOAM_ERRORS_CACHE) > _FOAM_ERRORS_CACHE_MAXSIZE:
+            _FOAM_ERRORS_CACHE.popitem(last=False)
     return error_logs
 
 def extract_commands_from_allrun_out(out_file: str) -> list:
@@ -1126,9 +1745,16 @@ def retrieve_faiss(database_name: str, query: str, topk: int = 1) -> dict:
     # Tokenize the query
     query = tokenize(query)
 
+    # Copy the memoized hits so callers can't mutate the cache.
+    return [dict(result) for result in _retrieve_faiss_cached(database_name, query, topk)]
+
+
+@functools.lru_cache(maxsize=4096)
+def _retrieve_faiss_cached(database_name: str, query: str, topk: int) -> tuple:
     vectordb = FAISS_DB_CACHE[database_name]
     try:
-        docs_and_scores = vectordb.similarity_search_with_score(query, k=topk)
+        vector = embed_queries_cached(vectordb, [query])[0]
+        docs_and_scores = vectordb.similarity_search_with_score_by_vector(vector.tolist(), k=topk)
         docs = [d for d, _ in docs_and_scores]
         scores = [s for _, s in docs_and_scores]
     except Exception:
@@ -1138,6 +1764,49 @@ def retrieve_faiss(database_name: str, query: str, topk: int = 1) -> dict:
     if not docs:
         raise ValueError(f"No documents found for query: {query}")
 
+    return tuple(_format_faiss_results(database_name, docs, scores))
+
+
+def retrieve_faiss_batch(database_name: str, queries: List[str], topk: int = 1) -> List[list]:
+    """
+    Retrieve the top-k documents for several queries with one embedding call
+    and one FAISS search.
+
+    Returns one result list per query, formatted like ``retrieve_faiss``.
+    Falls back to per-query ``retrieve_faiss`` calls if the vector store does
+    not expose the raw FAISS index.
+    """
+    if database_name not in FAISS_DB_CACHE:
+        raise ValueError(f"Database '{database_name}' is not loaded.")
+    if not queries:
+        return []
+
+    tokenized = [tokenize(q) for q in queries]
+    vectordb = FAISS_DB_CACHE[database_name]
+    try:
+        xq = embed_queries_cached(vectordb, tokenized)
+        if getattr(vectordb, "_normalize_L2", False):
+            faiss.normalize_L2(xq)
+        scores, indices = vectordb.index.search(xq, topk)
+    except Exception:
+        return [retrieve_faiss(database_name, q, topk) for q in queries]
+
+    results = []
+    for query, row_scores, row_indices in zip(tokenized, scores, indices):
+        docs = []
+        doc_scores = []
+        for i, score in zip(row_indices, row_scores):
+            if i == -1:
+                continue
+            docs.append(vectordb.docstore.search(vectordb.index_to_docstore_id[i]))
+            doc_scores.append(score)
+        if not docs:
+            raise ValueError(f"No documents found for query: {query}")
+        results.append(_format_faiss_results(database_name, docs, doc_scores))
+    return results
+
+
+def _format_faiss_results(database_name: str, docs: list, scores: list) -> list:
     formatted_results = []
     for doc, score in zip(docs, scores):
         metadata = doc.metadata or {}
@@ -1189,7 +1858,7 @@ def retrieve_faiss(database_name: str, query: str, topk: int = 1) -> dict:
             raise ValueError(f"Unknown database name: {database_name}")
 
     return formatted_results
-        
+
 
 def parse_directory_structure(data: str) -> dict:
     """
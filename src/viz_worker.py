@@ -0,0 +1,75 @@
+"""Persistent visualization worker (see services.visualization._run_in_worker).
+
+Started once as ``python viz_worker.py``; it imports PyVista/VTK up front and
+then forks one child per script, so each run skips interpreter startup and the
+PyVista import. It deliberately imports nothing from this package: starting it
+must not pull in services/utils (LLM clients, FAISS, ...).
+
+Protocol, one JSON object per line:
+  stdin:  {"script": path, "cwd": dir, "out": path, "err": path}
+  stdout: {"pid": child_pid}, then {"returncode": code} once the child exits
+          (negative code = killed by that signal, as in subprocess).
+"""
+import json
+import os
+import runpy
+import sys
+import traceback
+
+try:
+    import pyvista  # noqa: F401  (preloaded for the forked children)
+except ImportError:
+    pass
+
+
+def exec_script(script_path: str, cwd: str, out_path: str, err_path: str) -> None:
+    """Run script_path as __main__ in cwd with stdout/stderr redirected to files. Never returns."""
+    code = 0
+    try:
+        os.chdir(cwd)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)  # the worker's stdin carries the protocol
+        with open(out_path, "wb") as out, open(err_path, "wb") as err:
+            os.dup2(out.fileno(), 1)
+            os.dup2(err.fileno(), 2)
+        sys.stdin = open(0, closefd=False)
+        sys.stdout = open(1, "w", closefd=False)
+        sys.stderr = open(2, "w", closefd=False)
+        sys.argv = [script_path]
+        sys.path[0] = os.path.dirname(os.path.abspath(script_path))  # as for `python script.py`
+        runpy.run_path(script_path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            code = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def _reply(obj: dict) -> None:
+    sys.__stdout__.write(json.dumps(obj) + "\n")
+    sys.__stdout__.flush()
+
+
+def main() -> None:
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        pid = os.fork()
+        if pid == 0:
+            exec_script(request["script"], request["cwd"], request["out"], request["err"])
+        _reply({"pid": pid})
+        _, status = os.waitpid(pid, 0)
+        _reply({"returncode": os.waitstatus_to_exitcode(status)})
+
+
+if __name__ == "__main__":
+    main()
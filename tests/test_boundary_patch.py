@@ -0,0 +1,77 @@
+"""Unit tests for utils.apply_boundary_patch_changes (boundary-file patch protocol)."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from utils import apply_boundary_patch_changes  # noqa: E402
+
+BOUNDARY = """FoamFile
+{
+    version     2.0;
+    format      ascii;
+    class       polyBoundaryMesh;
+    location    "constant/polyMesh";
+    object      boundary;
+}
+
+3
+(
+    inlet
+    {
+        type            patch;
+        physicalType    patch;
+        nFaces          20;
+        startFace       760;
+    }
+    cylinder
+    {
+        type            patch;
+        nFaces          40;
+        startFace       780;
+    }
+    frontAndBack
+    {
+        type            patch;
+        physicalType    patch;
+        nFaces          800;
+        startFace       820;
+    }
+)
+"""
+
+
+def test_sets_type_and_physical_type():
+    patched = apply_boundary_patch_changes(
+        BOUNDARY, {"frontAndBack": {"type": "empty", "physicalType": "empty"}}
+    )
+    block = patched[patched.index("frontAndBack"):]
+    assert "type            empty;" in block
+    assert "physicalType    empty;" in block
+    # Other patches are untouched
+    assert patched[:patched.index("frontAndBack")] == BOUNDARY[:BOUNDARY.index("frontAndBack")]
+
+
+def test_adds_missing_physical_type_after_type():
+    patched = apply_boundary_patch_changes(
+        BOUNDARY, {"cylinder": {"type": "wall", "physicalType": "wall"}}
+    )
+    assert (
+        "    cylinder\n    {\n        type            wall;\n        physicalType    wall;\n        nFaces          40;"
+        in patched
+    )
+
+
+def test_no_changes_is_identity():
+    assert apply_boundary_patch_changes(BOUNDARY, {}) == BOUNDARY
+
+
+def test_unknown_patch_raises():
+    with pytest.raises(KeyError):
+        apply_boundary_patch_changes(BOUNDARY, {"outlet": {"type": "wall"}})
@@ -0,0 +1,109 @@
+"""Unit tests for the router keyword pre-checks that skip the classifier LLM calls."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from router_func import llm_requires_custom_mesh, llm_requires_hpc, llm_requires_visualization  # noqa: E402
+
+
+class _NoLLM:
+    """LLM service stand-in that fails the test if a classifier is called."""
+
+    def invoke(self, *args, **kwargs):
+        raise AssertionError("classifier LLM should have been skipped")
+
+
+class _AnswerLLM:
+    def __init__(self, answer: str):
+        self.answer = answer
+        self.calls = 0
+
+    def invoke(self, *args, **kwargs):
+        self.calls += 1
+        return self.answer
+
+
+def _state(requirement: str, llm) -> dict:
+    return {"user_requirement": requirement, "llm_service": llm}
+
+
+@pytest.mark.parametrize("requirement", [
+    "Show the velocity field at t=10s",
+    "Draw the pressure distribution around the cylinder",
+    "Slice through the wake and display U",
+    "Graph the results after the run",
+    "Plot velocity magnitude",
+    "Give me a picture of the flow",
+    "Visualise the temperature",
+])
+def test_visualization_wording_reaches_classifier(requirement):
+    llm = _AnswerLLM("yes_visualization")
+    assert llm_requires_visualization(_state(requirement, llm)) is True
+    assert llm.calls == 1
+
+
+@pytest.mark.parametrize("requirement", [
+    "Do a RANS simulation of incompressible lid-driven cavity flow with simpleFoam",
+    "Simulate 2D flow over a backward-facing step, Re=800, inlet velocity 1 m/s",
+])
+def test_visualization_skipped_without_hints(requirement):
+    assert llm_requires_visualization(_state(requirement, _NoLLM())) is False
+
+
+@pytest.mark.parametrize("requirement", [
+    "Run the cavity case on the cluster via SLURM",
+    "Submit this as an HPC job",
+    "Use sbatch with 4 compute nodes",
+])
+def test_hpc_wording_reaches_classifier(requirement):
+    llm = _AnswerLLM("hpc_run")
+    assert llm_requires_hpc(_state(requirement, llm)) is True
+    assert llm.calls == 1
+
+
+@pytest.mark.parametrize("requirement", [
+    "Run decomposePar and solve in parallel on 4 processors with mpirun",
+    "Simulate flow over a cylinder; mesh nodes are clustered near the wall",
+    "Channel flow with a remote outlet boundary and a queue of vortices",
+])
+def test_hpc_skipped_for_ordinary_cfd_wording(requirement):
+    assert llm_requires_hpc(_state(requirement, _NoLLM())) is False
+
+
+@pytest.mark.parametrize("requirement", [
+    "Run pimpleFoam on my mesh of the manifold",
+    "Use our mesh for the pipe bend",
+    "Simulate flow through the attached mesh",
+    "Use the given polyhedral mesh",
+    "The mesh is uploaded, run simpleFoam on it",
+    "Import the mesh and simulate laminar flow",
+    "Convert geometry.msh and run icoFoam",
+])
+def test_supplied_mesh_wording_reaches_classifier(requirement):
+    llm = _AnswerLLM("custom_mesh")
+    assert llm_requires_custom_mesh(_state(requirement, llm)) == 1
+    assert llm.calls == 1
+
+
+@pytest.mark.parametrize("requirement", [
+    "Lid-driven cavity with blockMesh, a 20x20 mesh and Re=10",
+    "Refine the mesh near the wall of the backward-facing step",
+])
+def test_mesh_classifier_skipped_for_generated_meshes(requirement):
+    assert llm_requires_custom_mesh(_state(requirement, _NoLLM())) == 0
+
+
+@pytest.mark.parametrize("answer", [
+    "gmsh_mesh is not needed here; custom_mesh",
+    "custom_mesh (not gmsh_mesh)",
+])
+def test_custom_mesh_answer_takes_priority_over_gmsh(answer):
+    llm = _AnswerLLM(answer)
+    assert llm_requires_custom_mesh(_state("Run icoFoam on geometry.msh", llm)) == 1
@@ -0,0 +1,48 @@
+"""Unit tests for the SLURM response-parsing helpers in services.run_hpc."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from services.run_hpc import ClusterInfo, _strip_code_fence  # noqa: E402
+
+
+def test_strip_code_fence_variants():
+    assert _strip_code_fence("```bash\n#!/bin/bash\necho hi\n```") == "#!/bin/bash\necho hi"
+    assert _strip_code_fence("```json\n{\"a\": 1}\n```\n") == "{\"a\": 1}"
+    assert _strip_code_fence("  #!/bin/bash\necho hi  ") == "#!/bin/bash\necho hi"
+
+
+def test_cluster_info_defaults_and_coercion():
+    info = ClusterInfo.from_llm({
+        "cluster_name": "Frontera",
+        "account_number": 12345,
+        "nodes": "2",
+        "time_limit": "24:00:00",
+        "memory": None,
+        "qos": "normal",
+    }).model_dump()
+
+    assert info["cluster_name"] == "Frontera"
+    assert info["account_number"] == "12345"
+    assert info["nodes"] == 2
+    assert info["time_limit"] == 24
+    assert info["memory"] == 64
+    assert info["partition"] == "normal"
+    assert info["qos"] == "normal"
+
+
+def test_cluster_info_keeps_requested_limits():
+    info = ClusterInfo.from_llm({"time_limit": "48:00:00", "memory": "128GB"})
+    assert info.time_limit == 48
+    assert info.memory == 128
+
+    assert ClusterInfo.from_llm({"time_limit": "1-12:30:00"}).time_limit == 36.5
+    assert ClusterInfo.from_llm({"time_limit": 48.5}).time_limit == 48.5
+    assert ClusterInfo.from_llm({"memory": "0.5TB"}).memory == 512
+    # Values that can't be parsed are passed through rather than replaced by defaults.
+    assert ClusterInfo.from_llm({"time_limit": "two days"}).time_limit == "two days"
@@ -0,0 +1,53 @@
+"""Unit tests for utils.apply_unified_diff (rewrite-mode patch protocol)."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from utils import apply_unified_diff  # noqa: E402
+
+CONTROL_DICT = """application     icoFoam;
+startTime       0;
+endTime         0.5;
+deltaT          0.005;
+writeInterval   20;
+"""
+
+
+def test_apply_replacement_hunk():
+    patch = (
+        "--- a/system/controlDict\n"
+        "+++ b/system/controlDict\n"
+        "@@ -2,3 +2,3 @@\n"
+        " startTime       0;\n"
+        " endTime         0.5;\n"
+        "-deltaT          0.005;\n"
+        "+deltaT          0.001;\n"
+    )
+    patched = apply_unified_diff(CONTROL_DICT, patch)
+    assert "deltaT          0.001;" in patched
+    assert "0.005" not in patched
+    assert patched.endswith("\n")
+
+
+def test_apply_hunk_with_wrong_line_numbers():
+    patch = (
+        "@@ -40,2 +40,3 @@\n"
+        " deltaT          0.005;\n"
+        "+adjustTimeStep  no;\n"
+        " writeInterval   20;\n"
+    )
+    patched = apply_unified_diff(CONTROL_DICT, patch)
+    assert patched.splitlines()[4] == "adjustTimeStep  no;"
+
+
+def test_mismatched_context_raises():
+    patch = "@@ -1,1 +1,1 @@\n-application     simpleFoam;\n+application     pisoFoam;\n"
+    with pytest.raises(ValueError):
+        apply_unified_diff(CONTROL_DICT, patch)
@@ -0,0 +1,51 @@
+"""Unit tests for tracking_aws usage persistence and request latency selection."""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import tracking_aws  # noqa: E402
+
+
+def _reset_caches():
+    tracking_aws._usage_cache.clear()
+    tracking_aws._pending_records.clear()
+    tracking_aws._file_totals.clear()
+
+
+def test_jsonl_records_are_summed(tmp_path):
+    _reset_caches()
+    path = tmp_path / "usage.jsonl"
+    tracking_aws._add_usage({"input_tokens": 10, "output_tokens": 5}, path, flush_every=1, model="m")
+    tracking_aws._add_usage({"input_tokens": 1, "output_tokens": 2}, path, flush_every=1, model="m")
+    _reset_caches()
+    assert tracking_aws.read_usage(path) == {"input_tokens": 11, "output_tokens": 7}
+
+
+def test_legacy_file_followed_by_appended_records(tmp_path):
+    _reset_caches()
+    path = tmp_path / "usage.json"
+    path.write_text(json.dumps({"input_tokens": 100, "output_tokens": 50, "cost": 0.5}, indent=4))
+    tracking_aws._add_usage({"input_tokens": 10, "output_tokens": 5, "cost": 0.25}, path, flush_every=1)
+    tracking_aws._add_usage({"input_tokens": 1, "output_tokens": 1, "cost": 0.25}, path, flush_every=1)
+    _reset_caches()
+    assert tracking_aws.read_usage(path) == {"input_tokens": 111, "output_tokens": 56, "cost": 1.0}
+
+
+def test_latency_optimized_only_for_supported_models():
+    optimized = next(iter(tracking_aws.latency_optimized_models))
+    assert tracking_aws._latency_for(optimized) == "optimized"
+    assert tracking_aws._latency_for("some-other-model") is None
+    with tracking_aws.use_model(latency="standard"):
+        assert tracking_aws._latency_for(optimized) == "standard"
+        assert tracking_aws._latency_for("some-other-model") is None
+    with pytest.raises(ValueError):
+        with tracking_aws.use_model(latency="optimized"):
+            pass